@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+Frota simulada de ESP8266 para testes de escala
+
+Cada device virtual segue o contrato MQTT do esp8266_firmware.ino: assina
+mcp/gpio/+/set e mcp/gpio/all/set, publica o estado retido em
+mcp/gpio/{pin}/status, a leitura do DHT11 em mcp/sensor/dht/* e os tópicos
+online (com LWT "0"), info e rssi de mcp/device/{id}/. Todos os devices rodam
+no mesmo loop asyncio, cada um com sua própria conexão ao broker, com ruído
+no sensor, perda de comandos, falhas de leitura e quedas configuráveis.
+
+O modo "bench" mede a latência comando → status de ponta a ponta como ela é
+vista pelas ferramentas do main.py: control_gpio_mcp envia o comando e
+get_gpio_status_mcp é consultada até o Node-RED refletir o status publicado
+pelos devices.
+
+Requer o aiomqtt (dependência opcional, usada só pelo simulador):
+    pip install aiomqtt
+
+Uso:
+    python esp8266_simulator.py run -n 50 --broker localhost --speed 10
+    python esp8266_simulator.py bench -n 50 --commands 200 -c 4 --drop 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+try:
+    import aiomqtt
+except ImportError:  # pragma: no cover - dependência opcional
+    aiomqtt = None
+
+from node_red_cassette import percentile
+
+logger = logging.getLogger("esp8266-sim")
+
+# Mesmos valores do firmware (esp8266_firmware.ino)
+MQTT_RECONNECT_DELAY_MS = 5000
+HEARTBEAT_INTERVAL_MS = 30000
+STATUS_PUBLISH_INTERVAL = 60000
+# Definido no config.h de cada placa; o flow do Node-RED assume leituras a cada 30 s
+DHT_INTERVAL_MS = 30000
+VALID_PINS = (2, 4, 5, 12, 13, 14, 16)
+FIRMWARE_VERSION = "1.0.0-sim"
+
+# Atraso entre pinos em publishAllStatus() (delay(20) no firmware)
+STATUS_FLOOD_DELAY_S = 0.02
+
+
+def parse_state(value: str) -> bool:
+    """Mesma regra do parseState() do firmware"""
+    return value.lower() in ("1", "on", "true", "high")
+
+
+async def _cancel_all(tasks: List["asyncio.Future"]) -> None:
+    """Cancela e aguarda as tarefas, repetindo o cancelamento enquanto alguma seguir viva"""
+    # O asyncio.wait_for do Python 3.11 (usado pelo aiomqtt em publish) pode engolir o
+    # cancelamento se a publicação terminar no mesmo instante
+    pending = [t for t in tasks if not t.done()]
+    while pending:
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending, timeout=0.1)
+        pending = [t for t in pending if not t.done()]
+    # Erros de tarefas encerradas durante o cancelamento são descartados junto com a sessão
+    for task in tasks:
+        if not task.cancelled():
+            task.exception()
+
+
+class SimulatedDevice:
+    """Um ESP8266 virtual conectado ao broker MQTT"""
+
+    def __init__(
+        self,
+        device_id: str,
+        broker: str = "localhost",
+        port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        speed: float = 1.0,
+        noise: float = 0.2,
+        latency_ms: float = 20.0,
+        drop_rate: float = 0.0,
+        dht_fail_rate: float = 0.0,
+        spike_rate: float = 0.0,
+        offline_rate: float = 0.0,
+        offline_s: float = 20.0,
+        seed: Optional[int] = None,
+    ):
+        self.device_id = device_id
+        self.broker = broker
+        self.port = port
+        self.username = username
+        self.password = password
+        self.speed = speed
+        self.noise = noise
+        self.latency_ms = latency_ms
+        self.drop_rate = drop_rate
+        self.dht_fail_rate = dht_fail_rate
+        self.spike_rate = spike_rate
+        self.offline_rate = offline_rate
+        self.offline_s = offline_s
+        self.rng = random.Random(seed)
+
+        self.online_topic = f"mcp/device/{device_id}/online"
+        self.gpio_state = {pin: 0 for pin in VALID_PINS}
+        self.online = False
+        self._started = time.monotonic()
+
+        # Cada placa tem seu ambiente e seu sinal WiFi
+        self.temperature = self.rng.uniform(22.0, 28.0)
+        self.humidity = self.rng.uniform(45.0, 65.0)
+        self.rssi = self.rng.randint(-80, -45)
+        self.ip = f"10.0.{self.rng.randint(0, 255)}.{self.rng.randint(2, 254)}"
+        self.chip_id = f"{self.rng.getrandbits(24):x}"
+
+        self.stats: Dict[str, int] = defaultdict(int)
+
+    def millis(self) -> int:
+        """Tempo desde o boot em ms (tempo simulado, acelerado por speed)"""
+        return int((time.monotonic() - self._started) * 1000 * self.speed)
+
+    def _interval(self, ms: float) -> float:
+        return ms / 1000 / self.speed
+
+    # ── Publicações ──────────────────────────────────────────
+
+    async def publish_gpio_status(self, client: "aiomqtt.Client", pin: int) -> None:
+        await client.publish(f"mcp/gpio/{pin}/status", str(self.gpio_state[pin]), retain=True)
+        self.stats["status_published"] += 1
+
+    async def publish_all_status(self, client: "aiomqtt.Client") -> None:
+        for pin in VALID_PINS:
+            await self.publish_gpio_status(client, pin)
+            await asyncio.sleep(STATUS_FLOOD_DELAY_S)
+
+    async def publish_device_info(self, client: "aiomqtt.Client") -> None:
+        info = {
+            "device_id": self.device_id,
+            "firmware": FIRMWARE_VERSION,
+            "ip": self.ip,
+            "rssi": self.rssi,
+            "chip_id": self.chip_id,
+            "free_heap": self.rng.randint(38000, 42000),
+            "num_pins": len(VALID_PINS),
+        }
+        await client.publish(f"mcp/device/{self.device_id}/info", json.dumps(info), retain=True)
+
+    def read_dht(self) -> Optional[Dict[str, float]]:
+        """Leitura simulada: deriva lenta do ambiente + ruído de medição; None = falha do sensor"""
+        self.temperature += self.rng.gauss(0, 0.05)
+        self.humidity = min(max(self.humidity + self.rng.gauss(0, 0.2), 20.0), 90.0)
+        if self.rng.random() < self.dht_fail_rate:
+            return None
+        temperature = self.temperature + self.rng.gauss(0, self.noise)
+        humidity = self.humidity + self.rng.gauss(0, self.noise * 2)
+        if self.rng.random() < self.spike_rate:
+            # Leitura espúria (fio solto, interferência), como as vistas em placas reais
+            temperature += self.rng.choice((-1, 1)) * self.rng.uniform(10, 40)
+        return {"temperature": round(temperature, 1), "humidity": round(humidity, 1)}
+
+    async def publish_dht_data(self, client: "aiomqtt.Client") -> None:
+        reading = self.read_dht()
+        if reading is None:
+            # O firmware só registra a falha no serial e não publica nada
+            self.stats["dht_failed"] += 1
+            return
+        await client.publish("mcp/sensor/dht/temperature", f"{reading['temperature']:.1f}", retain=True)
+        await client.publish("mcp/sensor/dht/humidity", f"{reading['humidity']:.1f}", retain=True)
+        data = {**reading, "device_id": self.device_id, "timestamp": self.millis()}
+        await client.publish("mcp/sensor/dht/data", json.dumps(data), retain=True)
+        self.stats["dht_published"] += 1
+
+    async def send_heartbeat(self, client: "aiomqtt.Client") -> None:
+        await client.publish(self.online_topic, "1", retain=True)
+        self.rssi = min(max(self.rssi + self.rng.randint(-2, 2), -90), -30)
+        await client.publish(f"mcp/device/{self.device_id}/rssi", str(self.rssi))
+
+    # ── Recebimento (onMqttMessage) ──────────────────────────
+
+    async def handle_message(self, client: "aiomqtt.Client", topic: str, payload: bytes) -> None:
+        msg = payload[:255].decode("utf-8", errors="replace").strip()
+        if self.rng.random() < self.drop_rate:
+            # Comando perdido (WiFi instável, buffer do PubSubClient cheio)
+            self.stats["dropped"] += 1
+            return
+        self.stats["commands"] += 1
+        if self.latency_ms > 0:
+            # Tempo de processamento no loop() + ida pelo WiFi
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency_ms) / 1000)
+
+        if topic == "mcp/gpio/all/set":
+            # O firmware atual testa "/set" antes e retorna em pinPart == "all", sem chegar
+            # a este ramo; o simulador segue o contrato documentado no cabeçalho do firmware
+            try:
+                items = json.loads(msg)
+            except ValueError:
+                return
+            if not isinstance(items, list):
+                return
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                pin = item.get("pin", 255)
+                state = item.get("state", "off")
+                if not isinstance(pin, int) or pin not in self.gpio_state:
+                    continue
+                self.gpio_state[pin] = int(parse_state(state if isinstance(state, str) else "off"))
+                await self.publish_gpio_status(client, pin)
+            return
+
+        if topic.startswith("mcp/gpio/") and topic.endswith("/set"):
+            try:
+                pin = int(topic[9:-4])
+            except ValueError:
+                return
+            if pin not in self.gpio_state:
+                return
+            self.gpio_state[pin] = int(parse_state(msg))
+            await self.publish_gpio_status(client, pin)
+
+    # ── Ciclo de vida ────────────────────────────────────────
+
+    async def _every(self, interval_ms: float, action) -> None:
+        # Placas ligadas em momentos diferentes: fase aleatória evita rajadas sincronizadas
+        await asyncio.sleep(self.rng.uniform(0, self._interval(interval_ms)))
+        while True:
+            await action()
+            await asyncio.sleep(self._interval(interval_ms))
+
+    async def _listen(self, client: "aiomqtt.Client") -> None:
+        # Mensagens tratadas uma a uma, como no loop() do firmware
+        async for message in client.messages:
+            await self.handle_message(client, message.topic.value, message.payload)
+
+    async def _crash_timer(self) -> None:
+        # offline_rate = quedas por hora de tempo simulado (processo de Poisson)
+        await asyncio.sleep(self.rng.expovariate(self.offline_rate / 3600) / self.speed)
+
+    async def _session(self, stop: asyncio.Event) -> bool:
+        """Uma conexão com o broker; retorna True se terminou por queda simulada"""
+        will = aiomqtt.Will(self.online_topic, "0", qos=1, retain=True)
+        async with aiomqtt.Client(
+            self.broker, self.port,
+            identifier=self.device_id,
+            username=self.username,
+            password=self.password,
+            will=will,
+        ) as client:
+            await client.publish(self.online_topic, "1", retain=True)
+            await client.subscribe("mcp/gpio/+/set", qos=1)
+            await client.subscribe("mcp/gpio/all/set", qos=1)
+            await client.subscribe(f"mcp/device/{self.device_id}/ota", qos=1)
+            await self.publish_device_info(client)
+            await self.publish_all_status(client)
+            self.online = True
+            self.stats["connects"] += 1
+
+            tasks = [
+                asyncio.ensure_future(self._listen(client)),
+                asyncio.ensure_future(self._every(HEARTBEAT_INTERVAL_MS, lambda: self.send_heartbeat(client))),
+                asyncio.ensure_future(self._every(STATUS_PUBLISH_INTERVAL, lambda: self.publish_all_status(client))),
+                asyncio.ensure_future(self._every(DHT_INTERVAL_MS, lambda: self.publish_dht_data(client))),
+            ]
+            stopper = asyncio.ensure_future(stop.wait())
+            crash = asyncio.ensure_future(self._crash_timer()) if self.offline_rate > 0 else None
+            watched = tasks + [stopper] + ([crash] if crash else [])
+            try:
+                done, _ = await asyncio.wait(watched, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.online = False
+                await _cancel_all(watched)
+
+            for task in done:
+                if task in tasks and task.exception():
+                    raise task.exception()
+
+            # A desconexão pelo context manager é limpa e não dispara o LWT, então o "0"
+            # que o broker publicaria em uma queda real é enviado antes de sair
+            await client.publish(self.online_topic, "0", qos=1, retain=True)
+            return crash is not None and crash in done
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Mantém o device conectado até stop, reconectando como o firmware"""
+        while not stop.is_set():
+            delay = self._interval(MQTT_RECONNECT_DELAY_MS)
+            try:
+                if await self._session(stop):
+                    self.stats["crashes"] += 1
+                    delay = self.rng.expovariate(1 / self.offline_s) / self.speed
+                    logger.info(f"{self.device_id}: queda simulada, offline por {delay:.1f} s")
+            except aiomqtt.MqttError as e:
+                self.stats["mqtt_errors"] += 1
+                logger.warning(f"{self.device_id}: {e}; tentando novamente em {delay:.1f} s")
+            if stop.is_set():
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+class SimulatedFleet:
+    """N devices virtuais no mesmo loop asyncio"""
+
+    def __init__(self, count: int, prefix: str = "esp8266-sim", ramp_s: float = 1.0,
+                 seed: Optional[int] = None, **device_kwargs: Any):
+        if aiomqtt is None:
+            raise RuntimeError("O simulador requer o pacote aiomqtt: pip install aiomqtt")
+        rng = random.Random(seed)
+        self.ramp_s = ramp_s
+        self.devices = [
+            SimulatedDevice(f"{prefix}-{i:03d}", seed=rng.getrandbits(32), **device_kwargs)
+            for i in range(1, count + 1)
+        ]
+        self._stop = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def _boot(self, device: SimulatedDevice, delay: float) -> None:
+        # Conexões espalhadas na rampa para não derrubar o broker no início
+        await asyncio.sleep(delay)
+        await device.run(self._stop)
+
+    async def start(self, wait_online: float = 10.0) -> int:
+        """Liga os devices e aguarda (até wait_online s) que todos conectem; retorna quantos estão online"""
+        count = len(self.devices)
+        for i, device in enumerate(self.devices):
+            delay = self.ramp_s * i / count if count > 1 else 0.0
+            self._tasks.append(asyncio.ensure_future(self._boot(device, delay)))
+        deadline = time.monotonic() + self.ramp_s + wait_online
+        while self.online_count() < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return self.online_count()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def online_count(self) -> int:
+        return sum(1 for d in self.devices if d.online)
+
+    def stats(self) -> Dict[str, int]:
+        totals: Dict[str, int] = defaultdict(int)
+        for device in self.devices:
+            for key, value in device.stats.items():
+                totals[key] += value
+        return dict(totals)
+
+
+def format_fleet_stats(fleet: SimulatedFleet) -> str:
+    s = fleet.stats()
+    return (
+        f"online {fleet.online_count()}/{len(fleet.devices)} | "
+        f"comandos {s.get('commands', 0)} (perdidos {s.get('dropped', 0)}) | "
+        f"status {s.get('status_published', 0)} | "
+        f"DHT {s.get('dht_published', 0)} (falhas {s.get('dht_failed', 0)}) | "
+        f"quedas {s.get('crashes', 0)} | erros MQTT {s.get('mqtt_errors', 0)}"
+    )
+
+
+def _device_kwargs(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "broker": args.broker,
+        "port": args.port,
+        "username": args.username,
+        "password": args.password,
+        "speed": args.speed,
+        "noise": args.noise,
+        "latency_ms": args.latency_ms,
+        "drop_rate": args.drop,
+        "dht_fail_rate": args.dht_fail,
+        "spike_rate": args.spike,
+        "offline_rate": args.offline_rate,
+        "offline_s": args.offline_s,
+    }
+
+
+async def _run(args: argparse.Namespace) -> None:
+    fleet = SimulatedFleet(args.devices, prefix=args.prefix, ramp_s=args.ramp, seed=args.seed,
+                           **_device_kwargs(args))
+    online = await fleet.start()
+    print(f"{online}/{args.devices} devices online em {args.broker}:{args.port} (Ctrl+C para parar)")
+    started = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            await asyncio.sleep(args.report)
+            print(f"[{time.monotonic() - started:7.1f} s] {format_fleet_stats(fleet)}")
+    finally:
+        await fleet.stop()
+
+
+class StatusMonitor:
+    """Assina mcp/gpio/+/status e registra quando o status esperado de um comando chega ao broker"""
+
+    def __init__(self, broker: str, port: int, username: Optional[str], password: Optional[str]):
+        self.client = aiomqtt.Client(broker, port, username=username, password=password)
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.client.__aenter__()
+        await self.client.subscribe("mcp/gpio/+/status")
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def stop(self) -> None:
+        if self._task:
+            await _cancel_all([self._task])
+        await self.client.__aexit__(None, None, None)
+
+    def expect(self, pin: int, value: int) -> Dict[str, Any]:
+        record = {"value": value, "first": None}
+        self.pending[pin] = record
+        return record
+
+    async def _listen(self) -> None:
+        async for message in self.client.messages:
+            try:
+                pin = int(message.topic.value.split("/")[2])
+                value = int(message.payload)
+            except ValueError:
+                continue
+            record = self.pending.get(pin)
+            if record is not None and value == record["value"] and record["first"] is None:
+                record["first"] = time.monotonic()
+
+
+def _tool_json(text: str, marker: str) -> Optional[Dict[str, Any]]:
+    """JSON anexado ao texto de uma ferramenta do main.py (ex: "Resultado: {...}")"""
+    if marker not in text:
+        return None
+    try:
+        return json.loads(text.split(marker, 1)[1])
+    except ValueError:
+        return None
+
+
+async def _bench(args: argparse.Namespace) -> None:
+    # Import tardio: o main.py depende do SDK MCP, desnecessário para "run"
+    import main
+
+    if args.node_red_url:
+        main.node_red_api.base_url = args.node_red_url.rstrip("/")
+
+    fleet = SimulatedFleet(args.devices, prefix=args.prefix, ramp_s=args.ramp, seed=args.seed,
+                           **_device_kwargs(args))
+    monitor = StatusMonitor(args.broker, args.port, args.username, args.password)
+    await monitor.start()
+    online = await fleet.start()
+    print(f"{online}/{args.devices} devices online; {args.commands} comandos, concorrência {args.concurrency}")
+
+    # Um comando por pino em voo: o status não identifica o comando que o gerou
+    pins = list(VALID_PINS)
+    pin_locks = {pin: asyncio.Lock() for pin in pins}
+    expected = {pin: 0 for pin in pins}
+    semaphore = asyncio.Semaphore(min(args.concurrency, len(pins)))
+    results: List[Dict[str, Any]] = []
+
+    async def confirmed_by_mcp(pin: int, value: int, since: str) -> bool:
+        reply = await main.handle_call_tool("get_gpio_status_mcp", {})
+        if reply.isError:
+            return False
+        status = _tool_json(reply.content[0].text, "Dados completos: ") or {}
+        entry = status.get("result", {}).get("states", {}).get(str(pin), {})
+        # source == "esp8266" só é gravado pelo flow quando o status chega do device
+        return (entry.get("source") == "esp8266" and entry.get("value") == value
+                and entry.get("timestamp", "") >= since)
+
+    async def one_command(index: int) -> None:
+        pin = pins[index % len(pins)]
+        async with semaphore, pin_locks[pin]:
+            value = 1 - expected[pin]
+            expected[pin] = value
+            record = monitor.expect(pin, value)
+            result: Dict[str, Any] = {"pin": pin, "tool_ms": None, "broker_ms": None, "mcp_ms": None}
+
+            started = time.monotonic()
+            reply = await main.handle_call_tool(
+                "control_gpio_mcp", {"pin": pin, "state": "on" if value else "off"}
+            )
+            result["tool_ms"] = (time.monotonic() - started) * 1000
+            text = reply.content[0].text
+            if reply.isError:
+                result["error"] = text.splitlines()[0]
+                results.append(result)
+                return
+            since = ((_tool_json(text, "Resultado: ") or {}).get("result") or {}).get("timestamp", "")
+
+            deadline = started + args.timeout
+            while time.monotonic() < deadline:
+                if await confirmed_by_mcp(pin, value, since):
+                    result["mcp_ms"] = (time.monotonic() - started) * 1000
+                    break
+                await asyncio.sleep(args.poll)
+
+            # Dá tempo para os demais devices aplicarem o comando antes de liberar o pino
+            await asyncio.sleep(max(0.0, min(args.settle, deadline - time.monotonic())))
+            if record["first"] is not None:
+                result["broker_ms"] = (record["first"] - started) * 1000
+            # O status é um tópico compartilhado e não identifica o device: a cobertura
+            # é conferida no estado interno dos devices simulados
+            online = [d for d in fleet.devices if d.online]
+            if online:
+                result["applied"] = sum(1 for d in online if d.gpio_state[pin] == value) / len(online)
+            results.append(result)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(one_command(i) for i in range(args.commands)))
+    finally:
+        elapsed = time.monotonic() - started
+        fleet_stats = format_fleet_stats(fleet)
+        await fleet.stop()
+        await monitor.stop()
+
+    errors = [r for r in results if "error" in r]
+    done = [r for r in results if "error" not in r]
+
+    def line(label: str, key: str) -> str:
+        values = [r[key] for r in done if r[key] is not None]
+        if not values:
+            return f"  {label:<22}: sem amostras"
+        return (f"  {label:<22}: p50 {percentile(values, 50):7.1f} ms | p95 {percentile(values, 95):7.1f} ms | "
+                f"max {max(values):7.1f} ms ({len(values)}/{len(results)})")
+
+    print(f"\n{len(results)} comandos em {elapsed:.1f} s ({len(results) / elapsed:.1f}/s)")
+    print(line("Chamada control_gpio", "tool_ms"))
+    print(line("Status no broker", "broker_ms"))
+    print(line("Status visível no MCP", "mcp_ms"))
+    timeouts = sum(1 for r in done if r["mcp_ms"] is None)
+    print(f"  Sem confirmação em {args.timeout:g} s: {timeouts}")
+    applied = [r["applied"] for r in done if "applied" in r]
+    if applied:
+        print(f"  Devices que aplicaram cada comando: {sum(applied) / len(applied) * 100:.1f}% em média")
+    if errors:
+        print(f"  Erros nas ferramentas: {len(errors)} (ex: {errors[0]['error']})")
+    print(f"  Frota: {fleet_stats}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Frota simulada de ESP8266 (contrato MQTT do firmware)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-n", "--devices", type=int, default=10, help="Quantidade de devices virtuais")
+    common.add_argument("--broker", default="localhost")
+    common.add_argument("--port", type=int, default=1883)
+    common.add_argument("--username")
+    common.add_argument("--password")
+    common.add_argument("--prefix", default="esp8266-sim", help="Prefixo do DEVICE_ID")
+    common.add_argument("--speed", type=float, default=1.0,
+                        help="Acelera os intervalos periódicos (heartbeat, status, DHT); 10 = 10x")
+    common.add_argument("--ramp", type=float, default=1.0, help="Segundos para conectar todos os devices")
+    common.add_argument("--noise", type=float, default=0.2, help="Desvio do ruído da temperatura (°C)")
+    common.add_argument("--latency-ms", type=float, default=20.0, help="Latência média de processamento")
+    common.add_argument("--drop", type=float, default=0.0, help="Probabilidade de perder um comando")
+    common.add_argument("--dht-fail", type=float, default=0.0, help="Probabilidade de falha na leitura do DHT")
+    common.add_argument("--spike", type=float, default=0.0, help="Probabilidade de leitura espúria do DHT")
+    common.add_argument("--offline-rate", type=float, default=0.0, help="Quedas por device por hora simulada")
+    common.add_argument("--offline-s", type=float, default=20.0, help="Duração média de cada queda (s simulados)")
+    common.add_argument("--seed", type=int)
+    common.add_argument("-v", "--verbose", action="store_true")
+
+    run = sub.add_parser("run", parents=[common], help="Mantém a frota conectada e mostra estatísticas")
+    run.add_argument("--duration", type=float, default=0, help="Segundos de execução (0 = até Ctrl+C)")
+    run.add_argument("--report", type=float, default=10.0, help="Intervalo entre estatísticas (s)")
+    run.set_defaults(func=lambda a: asyncio.run(_run(a)))
+
+    bench = sub.add_parser("bench", parents=[common],
+                           help="Mede a latência comando → status pelas ferramentas do main.py")
+    bench.add_argument("--commands", type=int, default=50)
+    bench.add_argument("-c", "--concurrency", type=int, default=1, help=f"Comandos simultâneos (máx. {len(VALID_PINS)})")
+    bench.add_argument("--timeout", type=float, default=5.0, help="Espera máxima pela confirmação (s)")
+    bench.add_argument("--poll", type=float, default=0.05, help="Intervalo entre consultas de status (s)")
+    bench.add_argument("--settle", type=float, default=0.2, help="Espera para os demais devices aplicarem o comando (s)")
+    bench.add_argument("--node-red-url", help="URL do Node-RED (padrão: a do main.py)")
+    bench.set_defaults(func=lambda a: asyncio.run(_bench(a)))
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if aiomqtt is None:
+        parser.error("o simulador requer o pacote aiomqtt: pip install aiomqtt")
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Analisador de flows do Node-RED
+
+Detecta assinaturas MQTT redundantes (vários nós `mqtt in` no mesmo tópico e
+broker) e cadeias de funções idênticas, e gera um flow otimizado em que um
+único assinante é distribuído (fan-out) para todos os consumidores. Cada
+mensagem passa a ser entregue pelo broker e convertida de JSON uma única vez.
+
+Uma cadeia é uma sequência linear de nós function em que cada nó envia tudo
+para o próximo e o próximo só recebe dele (ex: "Parse → Converter → Formatar").
+Uma função isolada é uma cadeia de tamanho 1.
+
+Uso em linha de comando:
+    python flow_analyzer.py mcp_mqtt_esp8266.json -o mcp_mqtt_esp8266.otimizado.json
+    python flow_analyzer.py --live --url http://192.168.0.44:1880
+    python flow_analyzer.py mcp_mqtt_esp8266.json --merge-functions --json
+
+Também disponível no servidor MCP como a ferramenta `analyze_flow`.
+"""
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Intervalo padrão de publicação do DHT11 no firmware (DHT_INTERVAL_MS)
+DEFAULT_MESSAGES_PER_MINUTE = 2.0
+
+# Propriedades que definem uma assinatura MQTT equivalente
+SUBSCRIPTION_KEYS = ("z", "broker", "topic", "qos", "datatype", "nl", "rap", "rh")
+
+# Propriedades que definem o comportamento de um nó function
+FUNCTION_KEYS = ("z", "func", "outputs", "initialize", "finalize", "libs", "timeout")
+
+
+def normalize_flows(data: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Aceita a lista de nós (API v1/arquivo exportado) ou {"rev", "flows"} (API v2)"""
+    if isinstance(data, dict) and "flows" in data:
+        return data["flows"], data.get("rev")
+    if isinstance(data, list):
+        return data, None
+    raise ValueError("Formato de flow não reconhecido: esperado lista de nós ou objeto com 'flows'")
+
+
+def topic_filter_covers(outer: str, inner: str) -> bool:
+    """True se toda mensagem aceita pelo filtro `inner` também é aceita por `outer`"""
+    outer_parts = outer.split("/")
+    inner_parts = inner.split("/")
+    for i, part in enumerate(outer_parts):
+        if part == "#":
+            return True
+        if i >= len(inner_parts):
+            return False
+        if part == "+":
+            if inner_parts[i] == "#":
+                return False
+            continue
+        if part != inner_parts[i]:
+            return False
+    return len(outer_parts) == len(inner_parts)
+
+
+def _subscription_key(node: Dict[str, Any]) -> tuple:
+    return tuple(str(node.get(k, "")) for k in SUBSCRIPTION_KEYS)
+
+
+def _function_key(node: Dict[str, Any]) -> str:
+    signature = json.dumps({k: node.get(k) for k in FUNCTION_KEYS}, sort_keys=True)
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest()
+
+
+def _label(node: Dict[str, Any]) -> str:
+    return node.get("name") or node["id"]
+
+
+def _static_subscribers(flows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Nós com entrada (inputs=1) assinam dinamicamente e não podem ser unificados
+    return [n for n in flows if n.get("type") == "mqtt in" and not n.get("inputs") and not n.get("d")]
+
+
+def find_redundant_subscriptions(flows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Grupos de nós `mqtt in` com assinatura idêntica (mesma aba, broker, tópico, QoS e formato)"""
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for node in _static_subscribers(flows):
+        groups[_subscription_key(node)].append(node)
+    return [nodes for nodes in groups.values() if len(nodes) > 1]
+
+
+def find_overlapping_subscriptions(flows: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Pares (amplo, específico) em que um filtro curinga já cobre outro filtro no mesmo broker"""
+    subscribers = _static_subscribers(flows)
+    pairs = []
+    for outer in subscribers:
+        for inner in subscribers:
+            if outer is inner or outer.get("broker") != inner.get("broker"):
+                continue
+            if outer.get("topic") == inner.get("topic"):
+                continue
+            if topic_filter_covers(outer.get("topic", ""), inner.get("topic", "")):
+                pairs.append((outer, inner))
+    return pairs
+
+
+def _is_function(node: Optional[Dict[str, Any]]) -> bool:
+    return bool(node) and node.get("type") == "function" and not node.get("d")
+
+
+def _function_chains(flows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Cadeias máximas de nós function, percorridas a jusante a partir de cada início"""
+    by_id = {n["id"]: n for n in flows if "id" in n}
+    incoming: Dict[str, int] = defaultdict(int)
+    for node in flows:
+        for targets in node.get("wires", []):
+            for target in targets:
+                incoming[target] += 1
+
+    def next_link(node: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Elo privado: única ligação de saída, para uma função que só recebe deste nó
+        targets = [t for port in node.get("wires", []) for t in port]
+        if len(targets) != 1:
+            return None
+        target = by_id.get(targets[0])
+        if not _is_function(target) or incoming[target["id"]] != 1 or target.get("z") != node.get("z"):
+            return None
+        return target
+
+    linked = {link["id"] for link in map(next_link, filter(_is_function, flows)) if link}
+    chains = []
+    for head in flows:
+        if not _is_function(head) or head["id"] in linked:
+            continue
+        chain, seen = [head], {head["id"]}
+        link = next_link(head)
+        while link is not None and link["id"] not in seen:
+            chain.append(link)
+            seen.add(link["id"])
+            link = next_link(link)
+        chains.append(chain)
+    return chains
+
+
+def find_identical_function_chains(flows: List[Dict[str, Any]]) -> List[List[List[Dict[str, Any]]]]:
+    """Grupos de cadeias de funções com código e configuração idênticos, nó a nó, na mesma aba"""
+    groups: Dict[tuple, List[List[Dict[str, Any]]]] = defaultdict(list)
+    for chain in _function_chains(flows):
+        groups[tuple(_function_key(n) for n in chain)].append(chain)
+    return [chains for chains in groups.values() if len(chains) > 1]
+
+
+def _merge_wires(nodes: List[Dict[str, Any]]) -> List[List[str]]:
+    """União das ligações de saída, preservando a ordem e sem duplicatas"""
+    outputs = max(len(n.get("wires", [])) for n in nodes)
+    merged: List[List[str]] = [[] for _ in range(outputs)]
+    for node in nodes:
+        for port, targets in enumerate(node.get("wires", [])):
+            for target in targets:
+                if target not in merged[port]:
+                    merged[port].append(target)
+    return merged
+
+
+def _redirect(flows: List[Dict[str, Any]], replaced: Dict[str, str]) -> None:
+    """Aponta para o nó mantido todas as ligações que iam para um nó removido"""
+    for node in flows:
+        if "wires" not in node:
+            continue
+        new_wires = []
+        for targets in node["wires"]:
+            port: List[str] = []
+            for target in targets:
+                target = replaced.get(target, target)
+                if target not in port:
+                    port.append(target)
+            new_wires.append(port)
+        node["wires"] = new_wires
+
+
+def optimize_flows(
+    flows: List[Dict[str, Any]],
+    merge_functions: bool = False,
+    messages_per_minute: float = DEFAULT_MESSAGES_PER_MINUTE,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Gera o flow otimizado e o relatório da análise.
+
+    Assinaturas idênticas são sempre unificadas: o primeiro nó de cada grupo é
+    mantido e recebe as ligações de todos os outros. Cadeias de funções
+    idênticas são apenas relatadas, a menos que merge_functions=True —
+    unificá-las elimina saídas duplicadas a jusante, o que altera o
+    comportamento do flow. Só são unificadas cadeias cujo último nó tem as
+    mesmas ligações de saída.
+    """
+    optimized = copy.deepcopy(flows)
+    by_id = {n["id"]: n for n in optimized if "id" in n}
+    removed: Dict[str, str] = {}
+    report: Dict[str, Any] = {
+        "nodes_before": len(flows),
+        "subscriptions": [],
+        "overlaps": [],
+        "functions": [],
+    }
+
+    for group in find_redundant_subscriptions(optimized):
+        keeper, duplicates = group[0], group[1:]
+        keeper["wires"] = _merge_wires(group)
+        for node in duplicates:
+            removed[node["id"]] = keeper["id"]
+        consumers = [by_id[t] for port in keeper["wires"] for t in port if t in by_id]
+        saved = len(duplicates)
+        report["subscriptions"].append({
+            "topic": keeper.get("topic"),
+            "broker": keeper.get("broker"),
+            "kept": keeper["id"],
+            "removed": [n["id"] for n in duplicates],
+            "removed_names": [_label(n) for n in duplicates],
+            "consumers": [_label(n) for n in consumers],
+            "deliveries_per_message": {"before": len(group), "after": 1},
+            "json_parses_per_message": {
+                "before": len(group) if keeper.get("datatype") == "json" else 0,
+                "after": 1 if keeper.get("datatype") == "json" else 0,
+            },
+            "handled_messages_saved_per_hour": round(saved * messages_per_minute * 60),
+        })
+
+    # As ligações são redirecionadas antes de comparar funções: duas cadeias
+    # alimentadas por assinantes agora unificados passam a ter a mesma origem
+    optimized = [n for n in optimized if n.get("id") not in removed]
+    _redirect(optimized, removed)
+
+    for outer, inner in find_overlapping_subscriptions(optimized):
+        report["overlaps"].append({
+            "broad": {"id": outer["id"], "name": _label(outer), "topic": outer.get("topic")},
+            "narrow": {"id": inner["id"], "name": _label(inner), "topic": inner.get("topic")},
+        })
+
+    function_removed: Dict[str, str] = {}
+    for group in find_identical_function_chains(optimized):
+        keeper = group[0]
+        same_outputs = all(chain[-1].get("wires") == keeper[-1].get("wires") for chain in group)
+        merged = merge_functions and same_outputs
+        if merged:
+            for chain in group[1:]:
+                for node, kept in zip(chain, keeper):
+                    function_removed[node["id"]] = kept["id"]
+        report["functions"].append({
+            "ids": [[n["id"] for n in chain] for chain in group],
+            "names": [" → ".join(_label(n) for n in chain) for chain in group],
+            "length": len(keeper),
+            "same_outputs": same_outputs,
+            "merged": merged,
+            "executions_saved_per_message": len(keeper) * (len(group) - 1) if merged else 0,
+        })
+
+    if function_removed:
+        optimized = [n for n in optimized if n.get("id") not in function_removed]
+        _redirect(optimized, function_removed)
+
+    report["nodes_after"] = len(optimized)
+    report["handled_messages_saved_per_hour"] = sum(
+        s["handled_messages_saved_per_hour"] for s in report["subscriptions"]
+    )
+    return optimized, report
+
+
+def format_report(report: Dict[str, Any], messages_per_minute: float = DEFAULT_MESSAGES_PER_MINUTE) -> str:
+    """Relatório legível da análise"""
+    lines = [f"Análise do flow: {report['nodes_before']} nós → {report['nodes_after']} nós\n"]
+
+    if report["subscriptions"]:
+        lines.append("Assinaturas MQTT redundantes:")
+        for s in report["subscriptions"]:
+            deliveries = s["deliveries_per_message"]
+            parses = s["json_parses_per_message"]
+            lines.append(f"  • {s['topic']} — {deliveries['before']} nós `mqtt in` → 1 ({s['kept']})")
+            lines.append(f"    Removidos   : {', '.join(s['removed_names'])}")
+            lines.append(f"    Consumidores: {', '.join(s['consumers'])}")
+            lines.append(f"    Por mensagem: {deliveries['before']} → 1 entregas, "
+                         f"{parses['before']} → {parses['after']} conversões JSON")
+            lines.append(f"    Economia    : ~{s['handled_messages_saved_per_hour']} mensagens/hora "
+                         f"(a {messages_per_minute:g} msg/min)")
+    else:
+        lines.append("Nenhuma assinatura MQTT redundante encontrada.")
+
+    if report["overlaps"]:
+        lines.append("\nFiltros curinga sobrepostos (informativo, não alterados):")
+        for o in report["overlaps"]:
+            lines.append(f"  • '{o['broad']['topic']}' ({o['broad']['name']}) já cobre "
+                         f"'{o['narrow']['topic']}' ({o['narrow']['name']})")
+
+    if report["functions"]:
+        lines.append("\nCadeias de funções idênticas:")
+        for f in report["functions"]:
+            status = "unificadas" if f["merged"] else (
+                "mesmas saídas — use merge_functions para unificar" if f["same_outputs"]
+                else "saídas diferentes — mantidas"
+            )
+            size = f"{f['length']} nós cada; " if f["length"] > 1 else ""
+            lines.append(f"  • {' | '.join(f['names'])} ({size}{status})")
+
+    lines.append(f"\nTotal: ~{report['handled_messages_saved_per_hour']} mensagens a menos por hora.")
+    return "\n".join(lines)
+
+
+async def _fetch_live(url: Optional[str]) -> Any:
+    # Import tardio: o main.py depende do SDK MCP, desnecessário para arquivos locais
+    from main import NodeRedAPI, NODE_RED_BASE_URL
+
+    return await NodeRedAPI(url or NODE_RED_BASE_URL).get_flows()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Analisa e otimiza flows do Node-RED")
+    parser.add_argument("flow_file", nargs="?", help="Arquivo de flow exportado (JSON)")
+    parser.add_argument("--live", action="store_true", help="Ler os flows implantados via /flows")
+    parser.add_argument("--url", help="URL do Node-RED para --live")
+    parser.add_argument("-o", "--output", help="Gravar o flow otimizado neste arquivo")
+    parser.add_argument("--merge-functions", action="store_true",
+                        help="Unificar também cadeias de funções idênticas com as mesmas saídas")
+    parser.add_argument("--rate", type=float, default=DEFAULT_MESSAGES_PER_MINUTE,
+                        help="Mensagens por minuto por tópico, para estimar a economia")
+    parser.add_argument("--json", action="store_true", help="Imprimir o relatório em JSON")
+    args = parser.parse_args()
+
+    if args.live == bool(args.flow_file):
+        parser.error("informe um arquivo de flow ou --live")
+
+    if args.live:
+        data = asyncio.run(_fetch_live(args.url))
+    else:
+        with open(args.flow_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+    flows, _rev = normalize_flows(data)
+    optimized, report = optimize_flows(flows, args.merge_functions, args.rate)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(format_report(report, args.rate))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(optimized, f, indent=4, ensure_ascii=False)
+        print(f"\nFlow otimizado gravado em {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Agendador de GPIO baseado em tempo
+
+Mantém as próximas ações em um heap (min-heap por horário) e dorme até a
+próxima ação vencida — sem varredura periódica. Ações que vencem no mesmo
+instante são agrupadas em uma única requisição control_multiple_gpio.
+
+Tipos de agendamento:
+    - único:      at="18:00" (próxima ocorrência) ou at="2026-10-20T18:00"
+    - recorrente: cron="0 18 * * 1-5" (minuto hora dia mês dia-da-semana)
+Ambos aceitam duration_minutes: após o tempo, o pino volta ao estado oposto.
+
+Os agendamentos são gravados em JSON e recarregados ao reiniciar o servidor,
+inclusive desligamentos pendentes de ações com duração e ações que falharam
+no Node-RED e aguardam nova tentativa.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("mcp-node-red.scheduler")
+
+# Ações com diferença menor que esta (s) são consideradas simultâneas
+SAME_INSTANT_S = 1.0
+
+# Lote que falhou no Node-RED: nova tentativa após RETRY_DELAY_S, enquanto a
+# ação tiver vencido há menos de RETRY_WINDOW_S (depois disso é descartada)
+RETRY_DELAY_S = 30.0
+RETRY_WINDOW_S = 15 * 60.0
+
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),  # 0 e 7 = domingo
+)
+
+
+class CronExpression:
+    """Expressão cron de 5 campos com *, listas, intervalos e passos (ex: "*/15 8-18 * * 1-5")"""
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Expressão cron deve ter 5 campos (minuto hora dia mês dia-da-semana): '{expression}'")
+        self.expression = expression
+        self.fields: Dict[str, Set[int]] = {}
+        for (name, low, high), part in zip(CRON_FIELDS, parts):
+            self.fields[name] = self._parse_field(part, low, high, name)
+        # Como no cron tradicional: com dia e dia-da-semana restritos, basta um dos dois
+        self.day_restricted = parts[2] != "*"
+        self.weekday_restricted = parts[4] != "*"
+
+    @staticmethod
+    def _parse_field(part: str, low: int, high: int, name: str) -> Set[int]:
+        values: Set[int] = set()
+        for item in part.split(","):
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Passo inválido no campo {name}: {step}")
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start_text, end_text = item.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Valor fora da faixa no campo {name}: '{part}' ({low}-{high})")
+            values.update(range(start, end + 1, step))
+        if name == "weekday" and 7 in values:
+            values.discard(7)
+            values.add(0)
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.fields["day"]
+        # datetime.weekday(): segunda=0; cron: domingo=0
+        weekday_ok = (dt.weekday() + 1) % 7 in self.fields["weekday"]
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """Primeira ocorrência estritamente depois de `after` (horário local)"""
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.fields["month"]:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.fields["hour"]:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.fields["minute"]:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Expressão cron sem ocorrências: '{self.expression}'")
+
+
+def parse_at(value: str, now: Optional[datetime] = None) -> datetime:
+    """Converte "HH:MM" (próxima ocorrência) ou data/hora ISO em datetime local"""
+    now = now or datetime.now()
+    try:
+        clock = datetime.strptime(value, "%H:%M")
+    except ValueError:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        # Horários com fuso são convertidos para o horário local (sem fuso)
+        return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+    dt = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    return dt if dt > now else dt + timedelta(days=1)
+
+
+def _opposite(state: str) -> str:
+    return "off" if state in ("on", "true", "1") else "on"
+
+
+class GpioScheduler:
+    """
+    Agendador de ações GPIO com heap de temporizadores.
+
+    `executor` recebe a lista [{"pin", "state"}, ...] de ações simultâneas e deve
+    enviá-las em uma única requisição ao Node-RED.
+    """
+
+    def __init__(
+        self,
+        executor: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        storage_path: Optional[Path] = None,
+    ):
+        self.executor = executor
+        self.storage_path = storage_path
+        self.schedules: Dict[str, Dict[str, Any]] = {}
+        # (horário epoch, seq, id do agendamento, tipo "start"/"end"/"retry"); entradas
+        # de agendamentos cancelados ou reprogramados são descartadas ao sair do heap
+        self._heap: List[Tuple[float, int, str, str]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.batches_sent = 0
+        # Ações que falharam, por pino: (estado, horário original); reenviadas em _retry_at
+        self._failed: Dict[int, Tuple[str, float]] = {}
+        self._retry_at: Optional[float] = None
+
+    # ── Persistência ────────────────────────────────────────
+    def load(self) -> None:
+        """Recarrega os agendamentos gravados, reprogramando os que venceram com o servidor parado"""
+        if not self.storage_path or not self.storage_path.exists():
+            return
+        try:
+            with open(self.storage_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            # Arquivo ilegível: iniciar sem agendamentos e preservá-lo para análise
+            logger.error(f"Não foi possível ler {self.storage_path}: {str(e)}")
+            return
+        if not isinstance(saved, dict) or not isinstance(saved.get("schedules", []), list):
+            logger.error(f"Formato inesperado em {self.storage_path}; agendamentos não recarregados")
+            return
+        now = time.time()
+        for schedule in saved.get("schedules", []):
+            # Uma entrada inválida não deve impedir o servidor de iniciar
+            try:
+                if self._restore(schedule, now):
+                    self.schedules[schedule["id"]] = schedule
+                    self._push_schedule(schedule)
+            except Exception as e:
+                logger.error(f"Agendamento ignorado ao recarregar ({schedule!r}): {str(e)}")
+        for item in saved.get("failed_gpios", []):
+            try:
+                if now - float(item["due"]) < RETRY_WINDOW_S:
+                    self._failed[int(item["pin"])] = (str(item["state"]), float(item["due"]))
+            except Exception as e:
+                logger.error(f"Ação pendente ignorada ao recarregar ({item!r}): {str(e)}")
+        if self._failed:
+            self._retry_at = now
+            self._push(now, "", "retry")
+        try:
+            self._save()
+        except OSError as e:
+            logger.error(f"Não foi possível gravar {self.storage_path}: {str(e)}")
+        logger.info(f"{len(self.schedules)} agendamento(s) GPIO recarregado(s)")
+
+    def _restore(self, schedule: Dict[str, Any], now: float) -> bool:
+        """Reprograma um agendamento gravado; False se não há mais nada a executar"""
+        # Campos obrigatórios e horários numéricos (um valor inválido no heap pararia o agendador)
+        schedule["id"] = str(schedule["id"])
+        schedule["pin"] = int(schedule["pin"])
+        schedule["state"] = str(schedule["state"])
+        for key in ("next_run", "pending_end"):
+            if schedule.get(key) is not None:
+                schedule[key] = float(schedule[key])
+        if schedule.get("cron"):
+            if (schedule.get("next_run") or 0) < now:
+                schedule["next_run"] = CronExpression(schedule["cron"]).next_after(datetime.now()).timestamp()
+        elif schedule.get("next_run") is not None and schedule["next_run"] < now:
+            # duration_minutes é gravado como None quando não informado
+            end = schedule["next_run"] + (schedule.get("duration_minutes") or 0) * 60
+            if schedule.get("duration_minutes") and end > now:
+                # Início perdido, mas a janela ainda está aberta: executar já,
+                # mantendo o horário original de término (duration_minutes não muda)
+                schedule["next_run"] = now
+                schedule["pending_end"] = end
+            else:
+                logger.warning(f"Agendamento {schedule['id']} perdido enquanto o servidor estava parado")
+                schedule["next_run"] = None
+        return schedule.get("next_run") is not None or schedule.get("pending_end") is not None
+
+    def _save(self) -> None:
+        if not self.storage_path:
+            return
+        tmp = self.storage_path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                "schedules": list(self.schedules.values()),
+                "failed_gpios": [
+                    {"pin": pin, "state": state, "due": due}
+                    for pin, (state, due) in self._failed.items()
+                ],
+            }, f, indent=2, ensure_ascii=False)
+        tmp.replace(self.storage_path)
+
+    # ── Heap ────────────────────────────────────────────────
+    def _push(self, due: float, schedule_id: str, kind: str) -> None:
+        heapq.heappush(self._heap, (due, next(self._seq), schedule_id, kind))
+        # Acorda o laço só se a nova ação for a próxima a vencer
+        if self._heap[0][2] == schedule_id and self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def _push_schedule(self, schedule: Dict[str, Any]) -> None:
+        if schedule.get("next_run") is not None:
+            self._push(schedule["next_run"], schedule["id"], "start")
+        if schedule.get("pending_end") is not None:
+            self._push(schedule["pending_end"], schedule["id"], "end")
+
+    def _is_current(self, schedule_id: str, kind: str, due: float) -> bool:
+        if kind == "retry":
+            return bool(self._failed) and self._retry_at is not None and abs(self._retry_at - due) < 1e-6
+        schedule = self.schedules.get(schedule_id)
+        if schedule is None:
+            return False
+        expected = schedule.get("next_run") if kind == "start" else schedule.get("pending_end")
+        return expected is not None and abs(expected - due) < 1e-6
+
+    # ── API ─────────────────────────────────────────────────
+    def add(
+        self,
+        pin: int,
+        state: str,
+        at: Optional[str] = None,
+        cron: Optional[str] = None,
+        duration_minutes: Optional[float] = None,
+        description: str = "",
+    ) -> Dict[str, Any]:
+        """Cria um agendamento único (at) ou recorrente (cron) e o grava"""
+        if bool(at) == bool(cron):
+            raise ValueError("Informe exatamente um entre 'at' (horário único) e 'cron' (recorrente)")
+        if duration_minutes is not None and duration_minutes <= 0:
+            raise ValueError("duration_minutes deve ser positivo")
+
+        now = datetime.now()
+        first = CronExpression(cron).next_after(now) if cron else parse_at(at, now)
+        if first <= now:
+            raise ValueError(f"Horário já passou: {first.isoformat(timespec='minutes')}")
+
+        schedule = {
+            "id": uuid.uuid4().hex[:8],
+            "pin": int(pin),
+            "state": state,
+            "at": at,
+            "cron": cron,
+            "duration_minutes": duration_minutes,
+            "description": description,
+            "next_run": first.timestamp(),
+            "pending_end": None,
+            "created": time.time(),
+        }
+        self.schedules[schedule["id"]] = schedule
+        self._push_schedule(schedule)
+        self._save()
+        return schedule
+
+    def cancel(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        """Remove o agendamento; as entradas no heap são descartadas quando vencerem"""
+        schedule = self.schedules.pop(schedule_id, None)
+        if schedule is not None:
+            self._save()
+        return schedule
+
+    def list_schedules(self) -> List[Dict[str, Any]]:
+        def next_event(s: Dict[str, Any]) -> float:
+            return min(t for t in (s.get("next_run"), s.get("pending_end")) if t is not None)
+        return sorted(self.schedules.values(), key=next_event)
+
+    # ── Execução ────────────────────────────────────────────
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            if self._heap:
+                timeout = max(self._heap[0][0] - time.time(), 0)
+            # asyncio.wait (e não wait_for) para que stop() nunca tenha o cancelamento engolido
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                done, _pending = await asyncio.wait({waiter}, timeout=timeout)
+            finally:
+                waiter.cancel()
+            if done:
+                continue  # Heap alterado: recalcular o próximo vencimento
+            try:
+                await self._fire_due()
+            except Exception:
+                # Um erro inesperado (ex: falha ao gravar o arquivo) não pode parar o agendador
+                logger.exception("Agendador: erro ao processar ações vencidas")
+
+    def _pop_due(self) -> List[Tuple[float, str, str]]:
+        """Retira do heap as ações vencidas no mesmo instante da primeira"""
+        due: List[Tuple[float, str, str]] = []
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            first = self._heap[0][0]
+            while self._heap and self._heap[0][0] - first < SAME_INSTANT_S:
+                when, _seq, schedule_id, kind = heapq.heappop(self._heap)
+                if self._is_current(schedule_id, kind, when):
+                    due.append((when, schedule_id, kind))
+            if due:
+                break
+        return due
+
+    async def _fire_due(self) -> None:
+        due = self._pop_due()
+        if not due:
+            return
+
+        # Um estado por pino: em conflito, a última ação agendada prevalece.
+        # Guarda também o horário original, para limitar as novas tentativas
+        actions: Dict[int, Tuple[str, float]] = {}
+        retried: Dict[int, Tuple[str, float]] = {}
+        for when, schedule_id, kind in due:
+            if kind == "retry":
+                retried, self._failed, self._retry_at = self._failed, {}, None
+                continue
+            schedule = self.schedules[schedule_id]
+            if kind == "start":
+                actions[schedule["pin"]] = (schedule["state"], when)
+                # Agendamento único recarregado com a janela aberta já traz o término original
+                if schedule.get("duration_minutes") and (schedule.get("cron") or schedule.get("pending_end") is None):
+                    schedule["pending_end"] = when + schedule["duration_minutes"] * 60
+                    self._push(schedule["pending_end"], schedule_id, "end")
+                if schedule.get("cron"):
+                    after = datetime.fromtimestamp(max(when, time.time()))
+                    schedule["next_run"] = CronExpression(schedule["cron"]).next_after(after).timestamp()
+                    self._push(schedule["next_run"], schedule_id, "start")
+                else:
+                    schedule["next_run"] = None
+            else:
+                actions[schedule["pin"]] = (_opposite(schedule["state"]), when)
+                schedule["pending_end"] = None
+            schedule["last_run"] = when
+
+            if schedule.get("next_run") is None and schedule.get("pending_end") is None:
+                del self.schedules[schedule_id]
+
+        # Ações novas substituem as que aguardavam nova tentativa no mesmo pino
+        for pin in actions:
+            self._failed.pop(pin, None)
+        actions = {**retried, **actions}
+
+        gpios = [{"pin": pin, "state": state} for pin, (state, _when) in actions.items()]
+        try:
+            await self.executor(gpios)
+            self.batches_sent += 1
+            logger.info(f"Agendador: {len(gpios)} GPIO(s) acionada(s) em uma requisição: {gpios}")
+        except Exception as e:
+            logger.error(f"Agendador: falha ao acionar {gpios}: {str(e)}")
+            self._keep_for_retry(actions)
+        self._save()
+
+    def _keep_for_retry(self, actions: Dict[int, Tuple[str, float]]) -> None:
+        """Guarda as ações de um lote que falhou para reenviá-las após RETRY_DELAY_S"""
+        now = time.time()
+        expired = [pin for pin, (_state, when) in actions.items() if now - when >= RETRY_WINDOW_S]
+        if expired:
+            logger.error(f"Agendador: ações dos pinos {expired} descartadas após {RETRY_WINDOW_S / 60:g} min de falhas")
+        self._failed.update({pin: action for pin, action in actions.items() if pin not in expired})
+        if self._failed:
+            self._retry_at = now + RETRY_DELAY_S
+            self._push(self._retry_at, "", "retry")
+            logger.warning(f"Agendador: nova tentativa para {len(self._failed)} GPIO(s) em {RETRY_DELAY_S:g} s")
@@ -5,15 +5,27 @@ Este servidor fornece ferramentas para criar, gerenciar e executar flows no Node
 """
 
 import asyncio
+import fnmatch
+import hashlib
 import json
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
 from pathlib import Path
 import httpx
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent
+from mcp.types import CallToolResult, Tool, TextContent
+
+from node_red_cassette import transport_from_env
+from flow_analyzer import format_report, normalize_flows, optimize_flows
+from sensor_metrics import SensorMetricsEngine, format_metrics, parse_timestamp
+from sensor_anomaly import AnomalyDetector, format_anomaly
+from sensor_feed import DhtFeed
+from gpio_scheduler import GpioScheduler
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -29,34 +41,122 @@ NODE_RED_ADMIN_AUTH = None  # Pode ser configurado se necessário
 class NodeRedAPI:
     """Cliente para interagir com a API REST do Node-RED"""
     
-    def __init__(self, base_url: str = NODE_RED_BASE_URL, auth: Optional[str] = None):
+    def __init__(
+        self,
+        base_url: str = NODE_RED_BASE_URL,
+        auth: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
         self.base_url = base_url.rstrip('/')
         self.auth = auth
+        self.transport = transport
+        self.flows_rev: Optional[str] = None
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self.cache_stats = {
+            "requests": 0, "not_modified": 0, "unchanged": 0,
+            "bytes_downloaded": 0, "bytes_saved": 0,
+        }
         self.headers = {"Content-Type": "application/json"}
         if auth:
             self.headers["Authorization"] = f"Bearer {auth}"
     
-    async def get_flows(self) -> Dict[str, Any]:
-        """Obtém todos os flows do Node-RED"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.base_url}/flows", headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+    def client(self) -> httpx.AsyncClient:
+        """Cria um cliente HTTP usando o transporte configurado (gravação/reprodução, se ativo)"""
+        return httpx.AsyncClient(transport=self.transport)
     
-    async def post_flows(self, flows: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Envia flows para o Node-RED"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/flows", 
-                json=flows, 
-                headers=self.headers
-            )
+    def _url(self, path_or_url: str) -> str:
+        return path_or_url if path_or_url.startswith("http") else f"{self.base_url}{path_or_url}"
+    
+    async def get_json(self, path_or_url: str, headers: Optional[Dict[str, str]] = None) -> Any:
+        """
+        GET com revalidação: guarda o último corpo com seu ETag e envia If-None-Match.
+        Em 304 (ou corpo idêntico ao anterior) reutiliza o objeto já convertido, sem
+        baixar nem converter o JSON de novo. O objeto retornado é compartilhado com o
+        cache e não deve ser modificado.
+        """
+        url = self._url(path_or_url)
+        request_headers = {**self.headers, **(headers or {})}
+        cached = self._cache.get(url)
+        if cached and cached["etag"]:
+            request_headers["If-None-Match"] = cached["etag"]
+        
+        async with self.client() as client:
+            response = await client.get(url, headers=request_headers)
+            if response.status_code == 304 and not cached:
+                # 304 sem corpo guardado (cache descartado, cassete reproduzido fora de
+                # ordem): pedir uma vez o corpo completo, sem If-None-Match
+                request_headers.pop("If-None-Match", None)
+                response = await client.get(url, headers=request_headers)
+        self.cache_stats["requests"] += 1
+        
+        if response.status_code == 304 and cached:
+            self.cache_stats["not_modified"] += 1
+            self.cache_stats["bytes_saved"] += cached["size"]
+            logger.debug(f"{url}: não modificado, {cached['size']} bytes economizados")
+            return cached["data"]
+        response.raise_for_status()
+        
+        body = response.content
+        digest = hashlib.sha1(body).hexdigest()
+        self.cache_stats["bytes_downloaded"] += len(body)
+        if cached and cached["digest"] == digest:
+            # Servidor sem ETag: o download acontece, mas a conversão é evitada
+            self.cache_stats["unchanged"] += 1
+            data = cached["data"]
+        else:
+            data = response.json()
+        
+        self._cache[url] = {
+            "etag": response.headers.get("etag"),
+            "digest": digest,
+            "size": len(body),
+            "data": data,
+        }
+        return data
+    
+    def invalidate(self, path_or_url: str) -> None:
+        """Descarta o corpo guardado de uma URL (após alterá-la via POST/PUT/DELETE)"""
+        self._cache.pop(self._url(path_or_url), None)
+    
+    async def get_flows(self, base_url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Obtém todos os flows do Node-RED (a revisão fica em flows_rev)"""
+        data = await self.get_json(
+            f"{(base_url or self.base_url).rstrip('/')}/flows",
+            headers={"Node-RED-API-Version": "v2"}
+        )
+        # API v2 responde {"rev", "flows"}; versões antigas respondem a lista
+        if isinstance(data, dict) and "flows" in data:
+            self.flows_rev = data.get("rev")
+            return data["flows"]
+        return data
+    
+    async def post_flows(self, flows: List[Dict[str, Any]], base_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Envia flows para o Node-RED. Com a revisão lida em get_flows, usa a API v2
+        ({"rev", "flows"}): o Node-RED recusa com 409 se os flows mudaram desde a
+        leitura, em vez de sobrescrever alterações feitas por outra pessoa.
+        """
+        url = f"{(base_url or self.base_url).rstrip('/')}/flows"
+        if self.flows_rev:
+            body: Any = {"rev": self.flows_rev, "flows": flows}
+            headers = {**self.headers, "Node-RED-API-Version": "v2"}
+        else:
+            body, headers = flows, self.headers
+        async with self.client() as client:
+            response = await client.post(url, json=body, headers=headers)
+            self.invalidate(url)
+            if response.status_code == 409:
+                self.flows_rev = None
+                raise RuntimeError("os flows foram alterados no Node-RED desde a leitura; leia-os novamente antes do deploy")
             response.raise_for_status()
-            return response.json()
+            # v1 responde 204 sem corpo; v2 devolve a nova revisão
+            result = response.json() if response.content else {}
+            self.flows_rev = result.get("rev") if isinstance(result, dict) else None
+            return result
     
     async def get_flow(self, flow_id: str) -> Dict[str, Any]:
         """Obtém um flow específico"""
-        async with httpx.AsyncClient() as client:
+        async with self.client() as client:
             response = await client.get(
                 f"{self.base_url}/flow/{flow_id}", 
                 headers=self.headers
@@ -66,34 +166,79 @@ class NodeRedAPI:
     
     async def put_flow(self, flow_id: str, flow_data: Dict[str, Any]) -> Dict[str, Any]:
         """Atualiza um flow específico"""
-        async with httpx.AsyncClient() as client:
+        async with self.client() as client:
             response = await client.put(
                 f"{self.base_url}/flow/{flow_id}", 
                 json=flow_data, 
                 headers=self.headers
             )
+            self.invalidate("/flows")
             response.raise_for_status()
             return response.json()
     
     async def delete_flow(self, flow_id: str) -> Dict[str, Any]:
         """Remove um flow específico"""
-        async with httpx.AsyncClient() as client:
+        async with self.client() as client:
             response = await client.delete(
                 f"{self.base_url}/flow/{flow_id}", 
                 headers=self.headers
             )
+            self.invalidate("/flows")
             response.raise_for_status()
+            # O Node-RED responde 204 sem corpo
+            if response.status_code == 204 or not response.content:
+                return {}
             return response.json()
     
+    async def stream_flow_to_file(self, flow_id: str, path: Path) -> int:
+        """Grava um flow direto em arquivo, em blocos, sem montar o JSON em memória; retorna os bytes gravados"""
+        written = 0
+        async with self.client() as client:
+            async with client.stream(
+                "GET",
+                f"{self.base_url}/flow/{flow_id}",
+                headers=self.headers
+            ) as response:
+                response.raise_for_status()
+                with open(path, 'wb') as f:
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+                        written += len(chunk)
+        return written
+    
     async def get_nodes(self) -> Dict[str, Any]:
         """Obtém todos os tipos de nós disponíveis"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{self.base_url}/nodes", headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+        return await self.get_json("/nodes", headers={"Accept": "application/json"})
+    
+    def format_cache_stats(self) -> str:
+        """Resumo do cache condicional: requisições, respostas 304 e bytes economizados"""
+        stats = self.cache_stats
+        return (
+            f"Cache condicional: {stats['requests']} requisições, "
+            f"{stats['not_modified']} não modificadas (304), "
+            f"{stats['unchanged']} com corpo idêntico, "
+            f"{stats['bytes_saved'] / 1024:.1f} KB economizados, "
+            f"{stats['bytes_downloaded'] / 1024:.1f} KB baixados"
+        )
 
 # Instância da API do Node-RED
-node_red_api = NodeRedAPI()
+node_red_api = NodeRedAPI(transport=transport_from_env())
+
+# Métricas derivadas do DHT11, alimentadas pelo dht_feed a cada leitura nova
+sensor_metrics = SensorMetricsEngine()
+
+# Detecção de anomalias do DHT11; eventos ficam na mesma ordem de grandeza da fila do Node-RED
+anomaly_detector = AnomalyDetector()
+anomaly_events: deque = deque(maxlen=100)
+anomaly_guard = {
+    "suppress_action_plans": False,  # suspender planos de ação enquanto houver sensor sinalizado
+    # Último estado enviado ao Node-RED; None = desconhecido (a suspensão fica em um global
+    # do Node-RED e sobrevive a reinícios do servidor), então o primeiro sync sempre envia
+    "plans_suspended": None,
+}
+
+# Agendamentos GPIO por horário, persistidos ao lado do main.py
+SCHEDULES_FILE = Path(__file__).parent / "gpio_schedules.json"
 
 @server.list_tools()
 async def handle_list_tools() -> List[Tool]:
@@ -189,7 +334,44 @@ async def handle_list_tools() -> List[Tool]:
             description="Obtém a leitura atual de temperatura e umidade do sensor DHT11 via Node-RED",
             inputSchema={
                 "type": "object",
-                "properties": {},
+                "properties": {
+                    "include_metrics": {
+                        "type": "boolean",
+                        "description": (
+                            "Incluir métricas derivadas: ponto de orvalho, índice de calor, "
+                            "variação em 5 min e valores suavizados (padrão: false)"
+                        ),
+                        "default": False
+                    }
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="get_sensor_metrics",
+            description=(
+                "Retorna métricas derivadas do DHT11 por device: ponto de orvalho, índice de calor, "
+                "taxa de variação de temperatura/umidade nos últimos 5 minutos e valores suavizados (EWMA). "
+                "As métricas são atualizadas pelo servidor a cada leitura do sensor, em segundo plano. "
+                "Evita buscar histórico e calcular no prompt."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "device_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Devices a consultar. Omitir para todos os devices conhecidos."
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": (
+                            "Consultar o Node-RED antes de responder (padrão: false; as leituras "
+                            "já chegam em segundo plano)"
+                        ),
+                        "default": False
+                    }
+                },
                 "required": []
             }
         ),
@@ -251,6 +433,41 @@ async def handle_list_tools() -> List[Tool]:
                 "required": []
             }
         ),
+        Tool(
+            name="configure_anomaly_detection",
+            description=(
+                "Ajusta a detecção de leituras anômalas do DHT11 feita pelo servidor (valor atípico, "
+                "salto impossível, fora da faixa, sensor travado). Anomalias aparecem em get_sensor_alerts. "
+                "Opcionalmente suspende os planos de ação no Node-RED enquanto algum sensor estiver sinalizado."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "z_threshold": {
+                        "type": "number",
+                        "description": "Z-score acima do qual a leitura é atípica (padrão: 4)"
+                    },
+                    "flatline_readings": {
+                        "type": "integer",
+                        "description": "Leituras idênticas seguidas para considerar o sensor travado (padrão: 120, ~1 h; 0 desativa)",
+                        "minimum": 0
+                    },
+                    "max_temp_rate": {
+                        "type": "number",
+                        "description": "Variação máxima plausível de temperatura (°C/min, padrão: 5)"
+                    },
+                    "max_humidity_rate": {
+                        "type": "number",
+                        "description": "Variação máxima plausível de umidade (%/min, padrão: 20)"
+                    },
+                    "suppress_action_plans": {
+                        "type": "boolean",
+                        "description": "Suspender os planos de ação enquanto houver sensor sinalizado"
+                    }
+                },
+                "required": []
+            }
+        ),
         Tool(
             name="set_action_plan",
             description=(
@@ -300,6 +517,284 @@ async def handle_list_tools() -> List[Tool]:
                 "required": []
             }
         ),
+        Tool(
+            name="create_gpio_schedule",
+            description=(
+                "Agenda uma ação GPIO por horário, executada pelo servidor MCP. "
+                "Use 'at' para uma vez (ex: '18:00' ou '2026-10-20T18:00') ou 'cron' para recorrente "
+                "(ex: '0 18 * * 1-5' = 18h em dias úteis). Com duration_minutes, o pino volta ao estado "
+                "oposto após o tempo (ex: ligar às 18:00 por 20 minutos). Os agendamentos persistem entre reinícios."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "pin": {
+                        "type": "integer",
+                        "description": "Número do pino GPIO",
+                        "minimum": 2,
+                        "maximum": 27
+                    },
+                    "state": {
+                        "type": "string",
+                        "enum": ["on", "off"],
+                        "description": "Estado a aplicar no horário agendado"
+                    },
+                    "at": {
+                        "type": "string",
+                        "description": "Horário único: 'HH:MM' (próxima ocorrência) ou data/hora ISO"
+                    },
+                    "cron": {
+                        "type": "string",
+                        "description": "Recorrência em cron de 5 campos: minuto hora dia mês dia-da-semana"
+                    },
+                    "duration_minutes": {
+                        "type": "number",
+                        "description": "Após este tempo, aplicar o estado oposto"
+                    },
+                    "description": {
+                        "type": "string",
+                        "description": "Objetivo do agendamento"
+                    }
+                },
+                "required": ["pin", "state"]
+            }
+        ),
+        Tool(
+            name="list_gpio_schedules",
+            description="Lista os agendamentos GPIO por horário, com a próxima execução de cada um.",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        ),
+        Tool(
+            name="cancel_gpio_schedule",
+            description="Cancela um agendamento GPIO pelo ID (obtido com list_gpio_schedules).",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "id": {
+                        "type": "string",
+                        "description": "ID do agendamento"
+                    }
+                },
+                "required": ["id"]
+            }
+        ),
+        Tool(
+            name="bulk_export_flows",
+            description=(
+                "Exporta vários flows (abas) do Node-RED para arquivos, um JSON por flow, "
+                "em paralelo. Selecione por lista de IDs ou por padrão do nome da aba."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "flow_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "IDs dos flows (abas)"
+                    },
+                    "label_pattern": {
+                        "type": "string",
+                        "description": "Padrão do nome da aba, com curingas (ex: 'Sala*', '*teste*'); alternativa a flow_ids"
+                    },
+                    "parallelism": {
+                        "type": "integer",
+                        "description": "Máximo de requisições simultâneas ao Node-RED (padrão: 4)",
+                        "minimum": 1,
+                        "maximum": 16,
+                        "default": 4
+                    },
+                    "output_dir": {
+                        "type": "string",
+                        "description": "Diretório de destino (padrão: flows_export ao lado do main.py)"
+                    }
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="bulk_update_flows",
+            description=(
+                "Altera propriedades de vários flows (abas) de uma vez, em paralelo — "
+                "ex: {\"info\": \"...\"} ou {\"label\": \"...\"}. Os nós de cada flow são preservados."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "flow_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "IDs dos flows (abas)"
+                    },
+                    "label_pattern": {
+                        "type": "string",
+                        "description": "Padrão do nome da aba, com curingas (ex: 'Sala*', '*teste*'); alternativa a flow_ids"
+                    },
+                    "parallelism": {
+                        "type": "integer",
+                        "description": "Máximo de requisições simultâneas ao Node-RED (padrão: 4)",
+                        "minimum": 1,
+                        "maximum": 16,
+                        "default": 4
+                    },
+                    "changes": {
+                        "type": "object",
+                        "description": "Propriedades da aba a alterar (label, info, env...)"
+                    }
+                },
+                "required": ["changes"]
+            }
+        ),
+        Tool(
+            name="bulk_set_flows_enabled",
+            description="Habilita ou desabilita vários flows (abas) de uma vez, em paralelo.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "flow_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "IDs dos flows (abas)"
+                    },
+                    "label_pattern": {
+                        "type": "string",
+                        "description": "Padrão do nome da aba, com curingas (ex: 'Sala*', '*teste*'); alternativa a flow_ids"
+                    },
+                    "parallelism": {
+                        "type": "integer",
+                        "description": "Máximo de requisições simultâneas ao Node-RED (padrão: 4)",
+                        "minimum": 1,
+                        "maximum": 16,
+                        "default": 4
+                    },
+                    "enabled": {
+                        "type": "boolean",
+                        "description": "true para habilitar, false para desabilitar"
+                    }
+                },
+                "required": ["enabled"]
+            }
+        ),
+        Tool(
+            name="bulk_delete_flows",
+            description=(
+                "Remove vários flows (abas) do Node-RED de uma vez, em paralelo. Com label_pattern, "
+                "apenas lista o que seria removido, a menos que dry_run=false seja informado."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "flow_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "IDs dos flows (abas)"
+                    },
+                    "label_pattern": {
+                        "type": "string",
+                        "description": "Padrão do nome da aba, com curingas (ex: 'Sala*', '*teste*'); alternativa a flow_ids"
+                    },
+                    "dry_run": {
+                        "type": "boolean",
+                        "description": (
+                            "Apenas listar os flows que seriam removidos "
+                            "(padrão: true com label_pattern, false com flow_ids)"
+                        )
+                    },
+                    "parallelism": {
+                        "type": "integer",
+                        "description": "Máximo de requisições simultâneas ao Node-RED (padrão: 4)",
+                        "minimum": 1,
+                        "maximum": 16,
+                        "default": 4
+                    }
+                },
+                "required": []
+            }
+        ),
+        Tool(
+            name="run_batch",
+            description=(
+                "Executa várias ferramentas deste servidor em uma única chamada. Passos independentes "
+                "rodam em paralelo; use depends_on para ordenar (ex: ler o sensor antes de ligar um pino). "
+                "Retorna o resultado, o status e o tempo de cada passo. Prefira esta ferramenta a várias "
+                "chamadas seguidas."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "description": "Passos a executar",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {
+                                    "type": "string",
+                                    "description": "Identificador do passo (padrão: posição na lista, a partir de 1)"
+                                },
+                                "tool": {
+                                    "type": "string",
+                                    "description": "Nome da ferramenta (ex: get_dht_sensor_mcp)"
+                                },
+                                "arguments": {
+                                    "type": "object",
+                                    "description": "Argumentos da ferramenta"
+                                },
+                                "depends_on": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "IDs dos passos que precisam terminar com sucesso antes deste"
+                                }
+                            },
+                            "required": ["tool"]
+                        }
+                    },
+                    "max_parallel": {
+                        "type": "integer",
+                        "description": "Máximo de passos simultâneos (padrão: 8)",
+                        "minimum": 1,
+                        "maximum": 32,
+                        "default": 8
+                    }
+                },
+                "required": ["steps"]
+            }
+        ),
+        Tool(
+            name="analyze_flow",
+            description=(
+                "Analisa um flow do Node-RED em busca de assinaturas MQTT redundantes e cadeias de funções idênticas. "
+                "Gera um flow otimizado com um único assinante por tópico distribuído aos consumidores "
+                "e relata a redução esperada de mensagens processadas."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "flow_file": {
+                        "type": "string",
+                        "description": "Arquivo de flow a analisar. Omitir para analisar os flows implantados (/flows)."
+                    },
+                    "merge_functions": {
+                        "type": "boolean",
+                        "description": "Unificar também cadeias de funções idênticas com as mesmas saídas (padrão: false)",
+                        "default": False
+                    },
+                    "output_file": {
+                        "type": "string",
+                        "description": "Gravar o flow otimizado neste arquivo"
+                    },
+                    "deploy": {
+                        "type": "boolean",
+                        "description": "Implantar o flow otimizado no Node-RED; só para os flows implantados (padrão: false)",
+                        "default": False
+                    }
+                },
+                "required": []
+            }
+        ),
         Tool(
             name="delete_action_plan",
             description="Remove um plano de ação autônomo pelo ID.",
@@ -316,11 +811,29 @@ async def handle_list_tools() -> List[Tool]:
         )
     ]
 
+# Handlers retornam o conteúdo em caso de sucesso ou tool_error(...) em caso de falha
+ToolResult = Union[List[TextContent], CallToolResult]
+
+
+def tool_error(text: str) -> CallToolResult:
+    """Resultado de falha de uma ferramenta: o texto vai ao modelo com isError marcado"""
+    return CallToolResult(content=[TextContent(type="text", text=text)], isError=True)
+
+
 @server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> CallToolResult:
     """
-    Manipula chamadas para as ferramentas do servidor
+    Manipula chamadas para as ferramentas do servidor.
+    Sempre retorna CallToolResult; isError indica falha (usado pelo cliente e pelo run_batch).
     """
+    result = await _dispatch_tool(name, arguments)
+    if isinstance(result, CallToolResult):
+        return result
+    return CallToolResult(content=result, isError=False)
+
+
+async def _dispatch_tool(name: str, arguments: Dict[str, Any]) -> ToolResult:
+    """Encaminha a chamada para o handler da ferramenta"""
     try:
         if name == "control_gpio_mcp":
             return await control_gpio_mcp(arguments)
@@ -334,26 +847,48 @@ async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextCon
             return await deploy_mcp_gpio_flow(arguments)
         elif name == "get_dht_sensor_mcp":
             return await get_dht_sensor_mcp(arguments)
+        elif name == "get_sensor_metrics":
+            return await get_sensor_metrics(arguments)
         elif name == "set_sensor_alert":
             return await set_sensor_alert(arguments)
         elif name == "get_sensor_alerts":
             return await get_sensor_alerts(arguments)
         elif name == "clear_sensor_alerts":
             return await clear_sensor_alerts(arguments)
+        elif name == "configure_anomaly_detection":
+            return await configure_anomaly_detection(arguments)
         elif name == "set_action_plan":
             return await set_action_plan(arguments)
         elif name == "list_action_plans":
             return await list_action_plans(arguments)
         elif name == "delete_action_plan":
             return await delete_action_plan(arguments)
+        elif name == "create_gpio_schedule":
+            return await create_gpio_schedule(arguments)
+        elif name == "list_gpio_schedules":
+            return await list_gpio_schedules(arguments)
+        elif name == "cancel_gpio_schedule":
+            return await cancel_gpio_schedule(arguments)
+        elif name == "bulk_export_flows":
+            return await bulk_export_flows(arguments)
+        elif name == "bulk_update_flows":
+            return await bulk_update_flows(arguments)
+        elif name == "bulk_set_flows_enabled":
+            return await bulk_set_flows_enabled(arguments)
+        elif name == "bulk_delete_flows":
+            return await bulk_delete_flows(arguments)
+        elif name == "run_batch":
+            return await run_batch(arguments)
+        elif name == "analyze_flow":
+            return await analyze_flow(arguments)
         else:
             raise ValueError(f"Ferramenta desconhecida: {name}")
     
     except Exception as e:
         logger.error(f"Erro ao executar ferramenta {name}: {str(e)}")
-        return [TextContent(type="text", text=f"Erro: {str(e)}")]
+        return tool_error(f"Erro: {str(e)}")
 
-async def control_gpio_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
+async def control_gpio_mcp(arguments: Dict[str, Any]) -> ToolResult:
     """Controla GPIO individual via API MCP do Node-RED"""
     try:
         pin = arguments["pin"]
@@ -369,7 +904,7 @@ async def control_gpio_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
         }
         
         # Fazer requisição para o endpoint MCP do Node-RED
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.post(
                 f"{node_red_api.base_url}/mcp/gpio/control",
                 json=mcp_data,
@@ -387,12 +922,9 @@ async def control_gpio_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
         
     except Exception as e:
         logger.error(f"Erro ao controlar GPIO: {str(e)}")
-        return [TextContent(
-            type="text",
-            text=f"Erro ao controlar GPIO: {str(e)}"
-        )]
+        return tool_error(f"Erro ao controlar GPIO: {str(e)}")
 
-async def control_multiple_gpio_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
+async def control_multiple_gpio_mcp(arguments: Dict[str, Any]) -> ToolResult:
     """Controla múltiplas GPIOs simultaneamente via API MCP do Node-RED"""
     try:
         gpios = arguments["gpios"]
@@ -406,7 +938,7 @@ async def control_multiple_gpio_mcp(arguments: Dict[str, Any]) -> List[TextConte
         }
         
         # Fazer requisição para o endpoint MCP do Node-RED
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.post(
                 f"{node_red_api.base_url}/mcp/gpio/control",
                 json=mcp_data,
@@ -424,16 +956,13 @@ async def control_multiple_gpio_mcp(arguments: Dict[str, Any]) -> List[TextConte
         
     except Exception as e:
         logger.error(f"Erro ao controlar múltiplas GPIOs: {str(e)}")
-        return [TextContent(
-            type="text",
-            text=f"Erro ao controlar múltiplas GPIOs: {str(e)}"
-        )]
+        return tool_error(f"Erro ao controlar múltiplas GPIOs: {str(e)}")
 
-async def get_gpio_status_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
+async def get_gpio_status_mcp(arguments: Dict[str, Any]) -> ToolResult:
     """Obtém status atual de todas as GPIOs via API MCP do Node-RED"""
     try:
         # Fazer requisição para o endpoint de status
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.get(
                 f"{node_red_api.base_url}/mcp/gpio/status",
                 headers={"Content-Type": "application/json"}
@@ -470,22 +999,13 @@ async def get_gpio_status_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
         
     except Exception as e:
         logger.error(f"Erro ao obter status das GPIOs: {str(e)}")
-        return [TextContent(
-            type="text",
-            text=f"Erro ao obter status das GPIOs: {str(e)}"
-        )]
+        return tool_error(f"Erro ao obter status das GPIOs: {str(e)}")
 
-async def list_mcp_tools(arguments: Dict[str, Any]) -> List[TextContent]:
+async def list_mcp_tools(arguments: Dict[str, Any]) -> ToolResult:
     """Lista todas as ferramentas MCP disponíveis no Node-RED"""
     try:
-        # Fazer requisição para o endpoint de ferramentas
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{node_red_api.base_url}/mcp/tools",
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            result = response.json()
+        # Fazer requisição para o endpoint de ferramentas (revalidada por ETag)
+        result = await node_red_api.get_json("/mcp/tools")
         
         tools = result.get("tools", [])
         
@@ -518,12 +1038,9 @@ async def list_mcp_tools(arguments: Dict[str, Any]) -> List[TextContent]:
         
     except Exception as e:
         logger.error(f"Erro ao listar ferramentas MCP: {str(e)}")
-        return [TextContent(
-            type="text",
-            text=f"Erro ao listar ferramentas MCP: {str(e)}"
-        )]
+        return tool_error(f"Erro ao listar ferramentas MCP: {str(e)}")
 
-async def deploy_mcp_gpio_flow(arguments: Dict[str, Any]) -> List[TextContent]:
+async def deploy_mcp_gpio_flow(arguments: Dict[str, Any]) -> ToolResult:
     """Implanta o flow MCP GPIO completo no Node-RED"""
     try:
         node_red_url = arguments.get("node_red_url", "http://localhost:1880")
@@ -532,36 +1049,29 @@ async def deploy_mcp_gpio_flow(arguments: Dict[str, Any]) -> List[TextContent]:
         flow_file = Path(__file__).parent / "flows_mcp_gpio_completo.json"
         
         if not flow_file.exists():
-            return [TextContent(
-                type="text",
-                text=f"❌ Arquivo de flow não encontrado: {flow_file}\n"
-                     f"Execute primeiro o script 'deploy_mcp_gpio_flow.py' para criar o arquivo."
-            )]
+            return tool_error(
+                f"❌ Arquivo de flow não encontrado: {flow_file}\n"
+                f"Execute primeiro o script 'deploy_mcp_gpio_flow.py' para criar o arquivo."
+            )
         
         with open(flow_file, 'r', encoding='utf-8') as f:
             flow_data = json.load(f)
         
-        # Fazer backup dos flows existentes
-        async with httpx.AsyncClient() as client:
-            backup_response = await client.get(f"{node_red_url}/flows")
-            
-            if backup_response.status_code == 200:
-                backup_file = Path(__file__).parent / "flows_backup.json"
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    json.dump(backup_response.json(), f, indent=2, ensure_ascii=False)
+        # Fazer backup dos flows existentes (revalidado por ETag: sem novo download se nada mudou)
+        try:
+            existing_flows = await node_red_api.get_flows(base_url=node_red_url)
+            backup_file = Path(__file__).parent / "flows_backup.json"
+            with open(backup_file, 'w', encoding='utf-8') as f:
+                json.dump(existing_flows, f, indent=2, ensure_ascii=False)
+        except httpx.HTTPStatusError:
+            existing_flows = []
+            node_red_api.flows_rev = None  # sem leitura válida, não há revisão a conferir
         
-        # Obter flows existentes e adicionar o novo
-        existing_flows = backup_response.json() if backup_response.status_code == 200 else []
+        # Adicionar o novo flow aos existentes
         updated_flows = existing_flows + flow_data
         
         # Deploy do flow atualizado
-        async with httpx.AsyncClient() as client:
-            deploy_response = await client.post(
-                f"{node_red_url}/flows",
-                json=updated_flows,
-                headers={'Content-Type': 'application/json'}
-            )
-            deploy_response.raise_for_status()
+        await node_red_api.post_flows(updated_flows, base_url=node_red_url)
         
         # Testar endpoints após deploy
         await asyncio.sleep(2)  # Aguardar processamento
@@ -570,19 +1080,16 @@ async def deploy_mcp_gpio_flow(arguments: Dict[str, Any]) -> List[TextContent]:
         
         # Teste 1: Listar ferramentas
         try:
-            async with httpx.AsyncClient() as client:
-                tools_response = await client.get(f"{node_red_url}/mcp/tools")
-                if tools_response.status_code == 200:
-                    tools = tools_response.json()
-                    test_results.append(f"✅ GET /mcp/tools - {len(tools.get('tools', []))} ferramentas")
-                else:
-                    test_results.append(f"❌ GET /mcp/tools - Status: {tools_response.status_code}")
+            tools = await node_red_api.get_json(f"{node_red_url}/mcp/tools")
+            test_results.append(f"✅ GET /mcp/tools - {len(tools.get('tools', []))} ferramentas")
+        except httpx.HTTPStatusError as e:
+            test_results.append(f"❌ GET /mcp/tools - Status: {e.response.status_code}")
         except Exception as e:
             test_results.append(f"❌ GET /mcp/tools - Erro: {e}")
         
         # Teste 2: Status das GPIOs
         try:
-            async with httpx.AsyncClient() as client:
+            async with node_red_api.client() as client:
                 status_response = await client.get(f"{node_red_url}/mcp/gpio/status")
                 if status_response.status_code == 200:
                     status = status_response.json()
@@ -600,6 +1107,7 @@ async def deploy_mcp_gpio_flow(arguments: Dict[str, Any]) -> List[TextContent]:
         success_text += f"   • GET  {node_red_url}/mcp/tools\n\n"
         success_text += f"🧪 Testes dos endpoints:\n"
         success_text += "\n".join(test_results)
+        success_text += f"\n\n📦 {node_red_api.format_cache_stats()}"
         success_text += f"\n\n📚 Exemplos de uso:\n"
         success_text += f"# Ligar GPIO 20\n"
         success_text += f'curl -X POST {node_red_url}/mcp/gpio/control \\\n'
@@ -617,15 +1125,86 @@ async def deploy_mcp_gpio_flow(arguments: Dict[str, Any]) -> List[TextContent]:
         
     except Exception as e:
         logger.error(f"Erro ao implantar flow MCP GPIO: {str(e)}")
-        return [TextContent(
-            type="text",
-            text=f"Erro ao implantar flow MCP GPIO: {str(e)}"
-        )]
+        return tool_error(f"Erro ao implantar flow MCP GPIO: {str(e)}")
+
+async def observe_dht_reading(data: Dict[str, Any]) -> bool:
+    """
+    Alimenta métricas e detector de anomalias com uma leitura do DHT11.
+    Retorna False se a leitura for inválida ou já tiver sido vista.
+    """
+    try:
+        temperature = float(data["temperature"])
+        humidity = float(data["humidity"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    device_id = data.get("device_id") or "esp8266-01"
+    t = parse_timestamp(data.get("timestamp"))
+    if not sensor_metrics.update(device_id, temperature, humidity, t):
+        return False
+
+    events = anomaly_detector.update(device_id, temperature, humidity, t)
+    for event in events:
+        if event["type"] == "anomaly":
+            logger.warning(f"Anomalia no sensor: {format_anomaly(event).strip()}")
+        elif event["type"] == "anomaly_warning":
+            logger.warning(f"Aviso do sensor: {format_anomaly(event).strip()}")
+        else:
+            logger.info(format_anomaly(event).strip())
+    anomaly_events.extend(events)
+    await sync_action_plan_suspension()
+    return True
+
+
+async def sync_action_plan_suspension(shutting_down: bool = False) -> None:
+    """
+    Suspende/retoma os planos de ação no Node-RED conforme a sinalização dos sensores.
+    Ao encerrar o servidor, retoma: sem ele ninguém retiraria a suspensão.
+    """
+    flagged = anomaly_detector.flagged_devices()
+    suspend = not shutting_down and anomaly_guard["suppress_action_plans"] and bool(flagged)
+    if suspend == anomaly_guard["plans_suspended"]:
+        return
+
+    reason = ", ".join(f"{d}: {'/'.join(r)}" for d, r in flagged.items()) if suspend else ""
+    try:
+        async with node_red_api.client() as client:
+            response = await client.post(
+                f"{node_red_api.base_url}/mcp/action/plans/suspend",
+                json={"suspended": suspend, "reason": reason},
+                headers={"Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+        anomaly_guard["plans_suspended"] = suspend
+        logger.info(f"Planos de ação {'suspensos' if suspend else 'retomados'} {reason}".strip())
+    except Exception as e:
+        logger.error(f"Erro ao {'suspender' if suspend else 'retomar'} planos de ação: {str(e)}")
+
+
+async def fetch_dht_reading() -> Optional[Dict[str, Any]]:
+    """Busca a última leitura do DHT11 no Node-RED (None se ainda não houver dados)"""
+    async with node_red_api.client() as client:
+        response = await client.get(
+            f"{node_red_api.base_url}/mcp/sensor/dht",
+            headers={"Content-Type": "application/json"}
+        )
+    if response.status_code == 503:
+        return None
+    response.raise_for_status()
+    data = response.json().get("result", {})
+    # No modo MQTT as leituras chegam direto dos devices; a cópia do Node-RED seria repetida
+    if dht_feed.mode == "polling":
+        await observe_dht_reading(data)
+    return data
+
+
+# Leituras contínuas do DHT11 para métricas e anomalias, sem depender de chamadas de ferramenta
+dht_feed = DhtFeed.from_env(observe_dht_reading, fetch_dht_reading)
 
-async def get_dht_sensor_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
+
+async def get_dht_sensor_mcp(arguments: Dict[str, Any]) -> ToolResult:
     """Obtém leitura de temperatura e umidade do sensor DHT11"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.get(
                 f"{node_red_api.base_url}/mcp/sensor/dht",
                 headers={"Content-Type": "application/json"}
@@ -633,9 +1212,11 @@ async def get_dht_sensor_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
             result = response.json()
 
         if response.status_code == 503:
-            return [TextContent(type="text", text=f"Sensor DHT11 ainda sem dados. {result.get('error', '')}")]
+            return tool_error(f"Sensor DHT11 ainda sem dados. {result.get('error', '')}")
 
         data = result.get("result", {})
+        if dht_feed.mode == "polling":
+            await observe_dht_reading(data)
         text = (
             f"Leitura do sensor DHT11:\n"
             f"  Temperatura : {data.get('temperature', 'N/A')} °C\n"
@@ -643,14 +1224,58 @@ async def get_dht_sensor_mcp(arguments: Dict[str, Any]) -> List[TextContent]:
             f"  Device      : {data.get('device_id', 'N/A')}\n"
             f"  Atualizado  : {data.get('timestamp', 'N/A')}"
         )
+        if arguments.get("include_metrics"):
+            metrics = sensor_metrics.metrics(data.get("device_id") or "esp8266-01")
+            if metrics:
+                text += "\n\nMétricas derivadas:\n" + format_metrics(metrics)
         return [TextContent(type="text", text=text)]
 
     except Exception as e:
         logger.error(f"Erro ao ler DHT sensor: {str(e)}")
-        return [TextContent(type="text", text=f"Erro ao ler sensor DHT11: {str(e)}")]
+        return tool_error(f"Erro ao ler sensor DHT11: {str(e)}")
+
+
+async def get_sensor_metrics(arguments: Dict[str, Any]) -> ToolResult:
+    """Retorna métricas derivadas do DHT11 para um ou vários devices"""
+    try:
+        if arguments.get("refresh", False):
+            await fetch_dht_reading()
 
+        device_ids = arguments.get("device_ids")
+        all_metrics = sensor_metrics.all_metrics(device_ids)
+        # No polling o Node-RED guarda só a última leitura (global dht_data): com vários devices,
+        # cada um só é visto nos ciclos em que foi o último a publicar
+        polling_note = (
+            "Modo polling: o Node-RED guarda só a leitura do último device que publicou. "
+            "Para acompanhar vários devices, inicie o servidor com MQTT_HOST definido."
+        )
+        if not all_metrics:
+            text = "Nenhuma leitura do DHT11 recebida ainda para os devices informados."
+            if dht_feed.mode == "polling" and device_ids:
+                text += f"\n{polling_note}"
+            return [TextContent(type="text", text=text)]
+
+        lines = [f"Métricas do sensor DHT11 ({len(all_metrics)} device(s)):\n"]
+        for m in all_metrics:
+            lines.append(f"[{m['device_id']}] {m['temperature']} °C, {m['humidity']} % — {m['timestamp']}")
+            lines.append(format_metrics(m))
+            lines.append("")
+        if device_ids:
+            missing = [d for d in device_ids if sensor_metrics.metrics(d) is None]
+            if missing:
+                lines.append(f"Sem leituras: {', '.join(missing)}")
+                if dht_feed.mode == "polling":
+                    lines.append(polling_note)
+        if dht_feed.mode == "polling" and len(sensor_metrics.devices()) > 1 and not device_ids:
+            lines.append(polling_note)
+        return [TextContent(type="text", text="\n".join(lines).rstrip())]
 
-async def set_sensor_alert(arguments: Dict[str, Any]) -> List[TextContent]:
+    except Exception as e:
+        logger.error(f"Erro ao calcular métricas: {str(e)}")
+        return tool_error(f"Erro ao calcular métricas do sensor: {str(e)}")
+
+
+async def set_sensor_alert(arguments: Dict[str, Any]) -> ToolResult:
     """Configura limiares de alerta para o sensor DHT11"""
     try:
         config = {}
@@ -664,9 +1289,9 @@ async def set_sensor_alert(arguments: Dict[str, Any]) -> List[TextContent]:
             config["humidity_below"] = float(arguments["humidity_below"])
 
         if not config:
-            return [TextContent(type="text", text="Nenhum limiar informado. Informe pelo menos um: temp_above, temp_below, humidity_above ou humidity_below.")]
+            return tool_error("Nenhum limiar informado. Informe pelo menos um: temp_above, temp_below, humidity_above ou humidity_below.")
 
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.post(
                 f"{node_red_api.base_url}/mcp/sensor/alerts/config",
                 json=config,
@@ -687,64 +1312,131 @@ async def set_sensor_alert(arguments: Dict[str, Any]) -> List[TextContent]:
 
     except Exception as e:
         logger.error(f"Erro ao configurar alertas: {str(e)}")
-        return [TextContent(type="text", text=f"Erro ao configurar alertas: {str(e)}")]
+        return tool_error(f"Erro ao configurar alertas: {str(e)}")
 
 
-async def get_sensor_alerts(arguments: Dict[str, Any]) -> List[TextContent]:
-    """Retorna alertas disparados do sensor DHT11"""
+async def get_sensor_alerts(arguments: Dict[str, Any]) -> ToolResult:
+    """Retorna alertas disparados do sensor DHT11 e anomalias detectadas pelo servidor"""
     try:
         clear = arguments.get("clear_after_read", True)
 
-        async with httpx.AsyncClient() as client:
+        # Avaliar a leitura mais recente antes de responder, para não perder anomalias
+        try:
+            await fetch_dht_reading()
+        except Exception as e:
+            logger.warning(f"Leitura do DHT11 indisponível para detecção de anomalias: {str(e)}")
+
+        async with node_red_api.client() as client:
             response = await client.get(f"{node_red_api.base_url}/mcp/sensor/alerts")
             response.raise_for_status()
             result = response.json()
 
         alerts = result.get("alerts", [])
         config = result.get("config", {})
+        anomalies = list(anomaly_events)
+        flagged = anomaly_detector.flagged_devices()
+        flagged_line = (
+            "Sensores sinalizados: " + ", ".join(f"{d} ({'/'.join(r)})" for d, r in flagged.items())
+            if flagged else ""
+        )
+        if flagged and anomaly_guard["plans_suspended"]:
+            flagged_line += "\nPlanos de ação suspensos até o sensor normalizar."
 
-        if not alerts:
+        if not alerts and not anomalies:
             cfg_lines = []
+            suffix = f"\n{flagged_line}" if flagged_line else ""
             if config:
                 if "temp_above"    in config: cfg_lines.append(f"temperatura > {config['temp_above']} °C")
                 if "temp_below"    in config: cfg_lines.append(f"temperatura < {config['temp_below']} °C")
                 if "humidity_above" in config: cfg_lines.append(f"umidade > {config['humidity_above']} %")
                 if "humidity_below" in config: cfg_lines.append(f"umidade < {config['humidity_below']} %")
-                return [TextContent(type="text", text=f"Nenhum alerta pendente.\nMonitorando: {', '.join(cfg_lines)}")]
-            return [TextContent(type="text", text="Nenhum alerta pendente e nenhum limiar configurado. Use set_sensor_alert() primeiro.")]
+                return [TextContent(type="text", text=f"Nenhum alerta pendente.\nMonitorando: {', '.join(cfg_lines)}{suffix}")]
+            return [TextContent(type="text", text=f"Nenhum alerta pendente e nenhum limiar configurado. Use set_sensor_alert() primeiro.{suffix}")]
 
-        lines = [f"ALERTA: {len(alerts)} alerta(s) disparado(s)!\n"]
+        lines = []
+        if alerts:
+            lines.append(f"ALERTA: {len(alerts)} alerta(s) disparado(s)!\n")
         for a in alerts:
+            if a.get("type") == "action_plan":
+                lines.append(f"  [{a['timestamp']}] Plano {a['plan_id']} executado: pino {a['gpio']} → "
+                             f"{a['gpio_action'].upper()} ({a['trigger']} {a['threshold']}, valor: {a['value']})")
+                continue
             tipo = "Temperatura" if a["type"] == "temperature" else "Umidade"
             unidade = "°C" if a["type"] == "temperature" else "%"
             lines.append(f"  [{a['timestamp']}] {tipo} {a['condition']} do limiar {a['threshold']}{unidade} → valor: {a['value']}{unidade}")
 
+        if anomalies:
+            if lines:
+                lines.append("")
+            lines.append(f"ANOMALIA: {len(anomalies)} evento(s) de leitura suspeita do sensor!\n")
+            lines.extend(format_anomaly(e) for e in anomalies)
+        if flagged_line:
+            lines.append(f"\n{flagged_line}")
+
         lines.append("\nAção sugerida: use control_gpio_mcp() para ligar/desligar dispositivos conforme necessário.")
+        if flagged:
+            lines.append("Atenção: leituras de sensores sinalizados podem estar erradas; confirme antes de agir.")
 
         if clear:
-            async with httpx.AsyncClient() as client:
+            async with node_red_api.client() as client:
                 await client.post(f"{node_red_api.base_url}/mcp/sensor/alerts/clear")
+            anomaly_events.clear()
             lines.append("(Fila limpa após leitura)")
 
         return [TextContent(type="text", text="\n".join(lines))]
 
     except Exception as e:
         logger.error(f"Erro ao ler alertas: {str(e)}")
-        return [TextContent(type="text", text=f"Erro ao ler alertas: {str(e)}")]
+        return tool_error(f"Erro ao ler alertas: {str(e)}")
 
 
-async def clear_sensor_alerts(arguments: Dict[str, Any]) -> List[TextContent]:
+async def clear_sensor_alerts(arguments: Dict[str, Any]) -> ToolResult:
     """Limpa a fila de alertas pendentes do sensor DHT11"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.post(f"{node_red_api.base_url}/mcp/sensor/alerts/clear")
             response.raise_for_status()
+        anomaly_events.clear()
         return [TextContent(type="text", text="Fila de alertas limpa com sucesso.")]
     except Exception as e:
-        return [TextContent(type="text", text=f"Erro ao limpar alertas: {str(e)}")]
+        return tool_error(f"Erro ao limpar alertas: {str(e)}")
+
+
+async def configure_anomaly_detection(arguments: Dict[str, Any]) -> ToolResult:
+    """Ajusta a detecção de anomalias do DHT11 e a suspensão dos planos de ação"""
+    try:
+        anomaly_detector.configure(**{
+            k: arguments[k]
+            for k in ("z_threshold", "flatline_readings", "max_temp_rate", "max_humidity_rate")
+            if k in arguments
+        })
+        if "suppress_action_plans" in arguments:
+            anomaly_guard["suppress_action_plans"] = bool(arguments["suppress_action_plans"])
+        await sync_action_plan_suspension()
+
+        config = anomaly_detector.config()
+        flagged = anomaly_detector.flagged_devices()
+        lines = [
+            "Detecção de anomalias do DHT11 configurada:",
+            f"  • Z-score acima de        : {config['z_threshold']}",
+            f"  • Sensor travado após     : {config['flatline_readings']} leituras idênticas",
+            f"  • Salto máximo temperatura: {config['max_temp_rate']} °C/min",
+            f"  • Salto máximo umidade    : {config['max_humidity_rate']} %/min",
+            f"  • Suspender planos de ação: {'sim' if anomaly_guard['suppress_action_plans'] else 'não'}",
+            "",
+            ("Sensores sinalizados: " + ", ".join(f"{d} ({'/'.join(r)})" for d, r in flagged.items()))
+            if flagged else "Nenhum sensor sinalizado.",
+        ]
+        if anomaly_guard["plans_suspended"]:
+            lines.append("Planos de ação suspensos no Node-RED.")
+        return [TextContent(type="text", text="\n".join(lines))]
+
+    except Exception as e:
+        logger.error(f"Erro ao configurar detecção de anomalias: {str(e)}")
+        return tool_error(f"Erro ao configurar detecção de anomalias: {str(e)}")
 
 
-async def set_action_plan(arguments: Dict[str, Any]) -> List[TextContent]:
+async def set_action_plan(arguments: Dict[str, Any]) -> ToolResult:
     """Cria ou atualiza um plano de ação autônomo baseado em sensor"""
     try:
         payload = {
@@ -757,7 +1449,7 @@ async def set_action_plan(arguments: Dict[str, Any]) -> List[TextContent]:
         if "id" in arguments:
             payload["id"] = arguments["id"]
 
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.post(
                 f"{node_red_api.base_url}/mcp/action/plan",
                 json=payload,
@@ -788,13 +1480,13 @@ async def set_action_plan(arguments: Dict[str, Any]) -> List[TextContent]:
 
     except Exception as e:
         logger.error(f"Erro ao criar plano: {str(e)}")
-        return [TextContent(type="text", text=f"Erro ao criar plano de ação: {str(e)}")]
+        return tool_error(f"Erro ao criar plano de ação: {str(e)}")
 
 
-async def list_action_plans(arguments: Dict[str, Any]) -> List[TextContent]:
+async def list_action_plans(arguments: Dict[str, Any]) -> ToolResult:
     """Lista planos de ação autônomos ativos"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.get(f"{node_red_api.base_url}/mcp/action/plans")
             response.raise_for_status()
             result = response.json()
@@ -810,6 +1502,9 @@ async def list_action_plans(arguments: Dict[str, Any]) -> List[TextContent]:
             "humidity_below": "umidade <",
         }
         lines = [f"Planos de ação ativos ({len(plans)} total):\n"]
+        if result.get("suspended"):
+            reason = result.get("suspension", {}).get("reason")
+            lines.insert(0, f"ATENÇÃO: planos suspensos por leituras anômalas do sensor{f' ({reason})' if reason else ''}.\n")
         for p in plans:
             status = "ativo" if p.get("active", True) else "inativo"
             label = trigger_labels.get(p["trigger"], p["trigger"])
@@ -822,13 +1517,13 @@ async def list_action_plans(arguments: Dict[str, Any]) -> List[TextContent]:
         return [TextContent(type="text", text="\n".join(lines))]
 
     except Exception as e:
-        return [TextContent(type="text", text=f"Erro ao listar planos: {str(e)}")]
+        return tool_error(f"Erro ao listar planos: {str(e)}")
 
 
-async def delete_action_plan(arguments: Dict[str, Any]) -> List[TextContent]:
+async def delete_action_plan(arguments: Dict[str, Any]) -> ToolResult:
     """Remove um plano de ação autônomo pelo ID"""
     try:
-        async with httpx.AsyncClient() as client:
+        async with node_red_api.client() as client:
             response = await client.post(
                 f"{node_red_api.base_url}/mcp/action/plan/delete",
                 json={"id": arguments["id"]},
@@ -837,7 +1532,383 @@ async def delete_action_plan(arguments: Dict[str, Any]) -> List[TextContent]:
             response.raise_for_status()
         return [TextContent(type="text", text=f"Plano '{arguments['id']}' removido com sucesso.")]
     except Exception as e:
-        return [TextContent(type="text", text=f"Erro ao remover plano: {str(e)}")]
+        return tool_error(f"Erro ao remover plano: {str(e)}")
+
+
+async def send_gpio_batch(gpios: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Envia várias ações GPIO ao Node-RED em uma única requisição control_multiple_gpio"""
+    mcp_data = {
+        "tool": "control_multiple_gpio",
+        "params": {
+            "gpios": gpios
+        }
+    }
+    async with node_red_api.client() as client:
+        response = await client.post(
+            f"{node_red_api.base_url}/mcp/gpio/control",
+            json=mcp_data,
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+gpio_scheduler = GpioScheduler(send_gpio_batch, SCHEDULES_FILE)
+
+
+def _format_schedule(schedule: Dict[str, Any]) -> List[str]:
+    def when(ts: Optional[float]) -> str:
+        return datetime.fromtimestamp(ts).strftime("%d/%m %H:%M") if ts else "—"
+
+    rule = f"cron '{schedule['cron']}'" if schedule.get("cron") else f"uma vez ({schedule['at']})"
+    lines = [f"  [{schedule['id']}] pino {schedule['pin']} → {schedule['state'].upper()} — {rule}"]
+    if schedule.get("duration_minutes"):
+        lines.append(f"    Duração: {schedule['duration_minutes']:g} min (depois → {'OFF' if schedule['state'] == 'on' else 'ON'})")
+    lines.append(f"    Próxima execução: {when(schedule.get('next_run'))}")
+    if schedule.get("pending_end"):
+        lines.append(f"    Retorno pendente: {when(schedule['pending_end'])}")
+    if schedule.get("description"):
+        lines.append(f"    Descrição: {schedule['description']}")
+    return lines
+
+
+async def create_gpio_schedule(arguments: Dict[str, Any]) -> ToolResult:
+    """Cria um agendamento GPIO por horário"""
+    try:
+        schedule = gpio_scheduler.add(
+            pin=arguments["pin"],
+            state=arguments["state"],
+            at=arguments.get("at"),
+            cron=arguments.get("cron"),
+            duration_minutes=arguments.get("duration_minutes"),
+            description=arguments.get("description", ""),
+        )
+        lines = [f"Agendamento criado! ID: {schedule['id']}", ""]
+        lines.extend(_format_schedule(schedule))
+        lines.append("\nUse list_gpio_schedules() para ver todos os agendamentos.")
+        return [TextContent(type="text", text="\n".join(lines))]
+
+    except Exception as e:
+        logger.error(f"Erro ao criar agendamento: {str(e)}")
+        return tool_error(f"Erro ao criar agendamento: {str(e)}")
+
+
+async def list_gpio_schedules(arguments: Dict[str, Any]) -> ToolResult:
+    """Lista os agendamentos GPIO por horário"""
+    try:
+        schedules = gpio_scheduler.list_schedules()
+        if not schedules:
+            return [TextContent(type="text", text="Nenhum agendamento GPIO. Use create_gpio_schedule() para criar um.")]
+
+        lines = [f"Agendamentos GPIO ({len(schedules)} total):\n"]
+        for schedule in schedules:
+            lines.extend(_format_schedule(schedule))
+            lines.append("")
+        return [TextContent(type="text", text="\n".join(lines).rstrip())]
+
+    except Exception as e:
+        logger.error(f"Erro ao listar agendamentos: {str(e)}")
+        return tool_error(f"Erro ao listar agendamentos: {str(e)}")
+
+
+async def cancel_gpio_schedule(arguments: Dict[str, Any]) -> ToolResult:
+    """Cancela um agendamento GPIO pelo ID"""
+    try:
+        schedule = gpio_scheduler.cancel(arguments["id"])
+        if schedule is None:
+            return tool_error(f"Agendamento '{arguments['id']}' não encontrado.")
+        text = f"Agendamento '{arguments['id']}' cancelado."
+        if schedule.get("pending_end"):
+            text += f"\nAtenção: o retorno pendente do pino {schedule['pin']} também foi cancelado; o pino permanece no estado atual."
+        return [TextContent(type="text", text=text)]
+
+    except Exception as e:
+        logger.error(f"Erro ao cancelar agendamento: {str(e)}")
+        return tool_error(f"Erro ao cancelar agendamento: {str(e)}")
+
+
+async def run_bounded(
+    items: List[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    parallelism: int,
+) -> List[Dict[str, Any]]:
+    """
+    Executa worker(item) para cada item com no máximo `parallelism` em andamento.
+    Retorna, na ordem dos itens, {"item", "ok", "result"|"error", "ms"}.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+
+    async def one(item: Any) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await worker(item)
+                outcome = {"item": item, "ok": True, "result": result}
+            except Exception as e:
+                # Mensagens do httpx trazem um link de ajuda na segunda linha
+                outcome = {"item": item, "ok": False, "error": (str(e).splitlines() or [repr(e)])[0]}
+            outcome["ms"] = (time.monotonic() - started) * 1000
+            return outcome
+
+    return await asyncio.gather(*(one(item) for item in items))
+
+
+async def resolve_flow_ids(arguments: Dict[str, Any]) -> Dict[str, str]:
+    """IDs → nomes das abas selecionadas por flow_ids ou label_pattern"""
+    tabs = {n["id"]: n.get("label", "") for n in await node_red_api.get_flows() if n.get("type") == "tab"}
+    if arguments.get("flow_ids"):
+        return {flow_id: tabs.get(flow_id, "?") for flow_id in arguments["flow_ids"]}
+    pattern = arguments.get("label_pattern")
+    if not pattern:
+        raise ValueError("Informe flow_ids ou label_pattern")
+    return {
+        flow_id: label for flow_id, label in tabs.items()
+        if fnmatch.fnmatch(label.lower(), pattern.lower())
+    }
+
+
+async def _bulk_flow_operation(
+    arguments: Dict[str, Any],
+    title: str,
+    worker: Callable[[str], Awaitable[str]],
+) -> ToolResult:
+    """Aplica worker(flow_id) aos flows selecionados e formata resultados e tempos por flow"""
+    flows = await resolve_flow_ids(arguments)
+    if not flows:
+        return [TextContent(type="text", text="Nenhum flow corresponde à seleção.")]
+
+    parallelism = int(arguments.get("parallelism", 4))
+    started = time.monotonic()
+    outcomes = await run_bounded(list(flows), worker, parallelism)
+    elapsed = time.monotonic() - started
+
+    ok = sum(1 for o in outcomes if o["ok"])
+    lines = [f"{title}: {ok}/{len(outcomes)} flow(s) com sucesso em {elapsed:.2f} s "
+             f"(paralelismo {parallelism})\n"]
+    for o in outcomes:
+        label = flows[o["item"]]
+        detail = o["result"] if o["ok"] else f"ERRO: {o['error']}"
+        lines.append(f"  {'✅' if o['ok'] else '❌'} {o['item']} ({label}) — {o['ms']:.0f} ms — {detail}")
+    text = "\n".join(lines)
+    # Qualquer flow com falha torna a operação uma falha (ex: para dependentes no run_batch)
+    if ok < len(outcomes):
+        return tool_error(text)
+    return [TextContent(type="text", text=text)]
+
+
+async def bulk_export_flows(arguments: Dict[str, Any]) -> ToolResult:
+    """Exporta vários flows para arquivos, em paralelo"""
+    try:
+        output_dir = Path(arguments.get("output_dir") or Path(__file__).parent / "flows_export")
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        async def export(flow_id: str) -> str:
+            path = output_dir / f"{flow_id}.json"
+            size = await node_red_api.stream_flow_to_file(flow_id, path)
+            return f"{size / 1024:.1f} KB → {path}"
+
+        return await _bulk_flow_operation(arguments, "Exportação", export)
+
+    except Exception as e:
+        logger.error(f"Erro ao exportar flows: {str(e)}")
+        return tool_error(f"Erro ao exportar flows: {str(e)}")
+
+
+async def bulk_update_flows(arguments: Dict[str, Any]) -> ToolResult:
+    """Altera propriedades de vários flows, em paralelo"""
+    try:
+        changes = dict(arguments["changes"])
+        # id e nós não são alterados em massa
+        for key in ("id", "nodes", "configs", "subflows"):
+            changes.pop(key, None)
+        if not changes:
+            return tool_error("Nenhuma propriedade para alterar em 'changes'.")
+
+        async def update(flow_id: str) -> str:
+            flow = await node_red_api.get_flow(flow_id)
+            flow.update(changes)
+            await node_red_api.put_flow(flow_id, flow)
+            return f"alterado: {', '.join(changes)}"
+
+        return await _bulk_flow_operation(arguments, "Atualização", update)
+
+    except Exception as e:
+        logger.error(f"Erro ao atualizar flows: {str(e)}")
+        return tool_error(f"Erro ao atualizar flows: {str(e)}")
+
+
+async def bulk_set_flows_enabled(arguments: Dict[str, Any]) -> ToolResult:
+    """Habilita ou desabilita vários flows, em paralelo"""
+    try:
+        enabled = bool(arguments["enabled"])
+
+        async def set_enabled(flow_id: str) -> str:
+            flow = await node_red_api.get_flow(flow_id)
+            if flow.get("disabled", False) == (not enabled):
+                return "já estava " + ("habilitado" if enabled else "desabilitado")
+            flow["disabled"] = not enabled
+            await node_red_api.put_flow(flow_id, flow)
+            return "habilitado" if enabled else "desabilitado"
+
+        title = "Habilitação" if enabled else "Desabilitação"
+        return await _bulk_flow_operation(arguments, title, set_enabled)
+
+    except Exception as e:
+        logger.error(f"Erro ao alterar estado dos flows: {str(e)}")
+        return tool_error(f"Erro ao alterar estado dos flows: {str(e)}")
+
+
+async def bulk_delete_flows(arguments: Dict[str, Any]) -> ToolResult:
+    """Remove vários flows, em paralelo"""
+    try:
+        # Um padrão como "*" seleciona todas as abas: sem dry_run=false explícito, só lista
+        if arguments.get("dry_run", not arguments.get("flow_ids")):
+            flows = await resolve_flow_ids(arguments)
+            if not flows:
+                return [TextContent(type="text", text="Nenhum flow corresponde à seleção.")]
+            lines = [f"Simulação: {len(flows)} flow(s) seriam removidos:"]
+            lines.extend(f"  • {flow_id} ({label})" for flow_id, label in flows.items())
+            lines.append("\nNada foi removido. Para remover, chame novamente com dry_run=false.")
+            return [TextContent(type="text", text="\n".join(lines))]
+
+        async def delete(flow_id: str) -> str:
+            await node_red_api.delete_flow(flow_id)
+            return "removido"
+
+        return await _bulk_flow_operation(arguments, "Remoção", delete)
+
+    except Exception as e:
+        logger.error(f"Erro ao remover flows: {str(e)}")
+        return tool_error(f"Erro ao remover flows: {str(e)}")
+
+
+def _plan_batch(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normaliza os passos do lote e valida IDs, dependências e ciclos"""
+    planned = []
+    for index, step in enumerate(steps, 1):
+        if step.get("tool") == "run_batch":
+            raise ValueError("run_batch não pode ser aninhado")
+        planned.append({
+            "id": str(step.get("id") or index),
+            "tool": step["tool"],
+            "arguments": step.get("arguments") or {},
+            "depends_on": [str(d) for d in step.get("depends_on") or []],
+        })
+
+    ids = [p["id"] for p in planned]
+    duplicates = {i for i in ids if ids.count(i) > 1}
+    if duplicates:
+        raise ValueError(f"IDs de passo repetidos: {', '.join(sorted(duplicates))}")
+    for p in planned:
+        unknown = [d for d in p["depends_on"] if d not in ids]
+        if unknown:
+            raise ValueError(f"Passo '{p['id']}' depende de passos inexistentes: {', '.join(unknown)}")
+
+    # Ordenação topológica (Kahn) apenas para detectar ciclos
+    remaining = {p["id"]: set(p["depends_on"]) for p in planned}
+    while remaining:
+        ready = [i for i, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependências circulares entre os passos: {', '.join(sorted(remaining))}")
+        for i in ready:
+            del remaining[i]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return planned
+
+
+async def run_batch(arguments: Dict[str, Any]) -> ToolResult:
+    """Executa várias ferramentas em uma chamada, em paralelo respeitando dependências"""
+    try:
+        planned = _plan_batch(arguments["steps"])
+        if not planned:
+            return tool_error("Nenhum passo informado.")
+
+        semaphore = asyncio.Semaphore(int(arguments.get("max_parallel", 8)))
+        finished = {p["id"]: asyncio.Event() for p in planned}
+        results: Dict[str, Dict[str, Any]] = {}
+
+        async def run_step(step: Dict[str, Any]) -> None:
+            try:
+                for dep in step["depends_on"]:
+                    await finished[dep].wait()
+                failed = [d for d in step["depends_on"] if results[d]["status"] != "ok"]
+                if failed:
+                    results[step["id"]] = {"status": "pulado", "ms": 0.0,
+                                           "text": f"Dependência sem sucesso: {', '.join(failed)}"}
+                    return
+                async with semaphore:
+                    started = time.monotonic()
+                    result = await handle_call_tool(step["tool"], step["arguments"])
+                    elapsed = (time.monotonic() - started) * 1000
+                text = "\n".join(c.text for c in result.content if c.type == "text")
+                status = "erro" if result.isError else "ok"
+                results[step["id"]] = {"status": status, "ms": elapsed, "text": text}
+            finally:
+                finished[step["id"]].set()
+
+        started = time.monotonic()
+        await asyncio.gather(*(run_step(p) for p in planned))
+        elapsed = time.monotonic() - started
+
+        counts = {s: sum(1 for r in results.values() if r["status"] == s) for s in ("ok", "erro", "pulado")}
+        serial_ms = sum(r["ms"] for r in results.values())
+        lines = [
+            f"Lote com {len(planned)} passo(s) em {elapsed * 1000:.0f} ms "
+            f"(soma sequencial: {serial_ms:.0f} ms) — {counts['ok']} ok, "
+            f"{counts['erro']} com erro, {counts['pulado']} pulado(s)\n"
+        ]
+        icons = {"ok": "✅", "erro": "❌", "pulado": "⏭️"}
+        for p in planned:
+            r = results[p["id"]]
+            deps = f" (após {', '.join(p['depends_on'])})" if p["depends_on"] else ""
+            lines.append(f"{icons[r['status']]} [{p['id']}] {p['tool']}{deps} — {r['status']} — {r['ms']:.0f} ms")
+            lines.extend(f"    {line}" for line in r["text"].splitlines())
+            lines.append("")
+        text = "\n".join(lines).rstrip()
+        if counts["erro"] or counts["pulado"]:
+            return tool_error(text)
+        return [TextContent(type="text", text=text)]
+
+    except Exception as e:
+        logger.error(f"Erro ao executar lote: {str(e)}")
+        return tool_error(f"Erro ao executar lote: {str(e)}")
+
+
+async def analyze_flow(arguments: Dict[str, Any]) -> ToolResult:
+    """Analisa e otimiza assinaturas MQTT redundantes de um flow"""
+    try:
+        flow_file = arguments.get("flow_file")
+        if flow_file:
+            with open(flow_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            data = await node_red_api.get_flows()
+
+        flows, _rev = normalize_flows(data)
+        optimized, report = optimize_flows(flows, arguments.get("merge_functions", False))
+        text = format_report(report)
+
+        output_file = arguments.get("output_file")
+        if output_file:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(optimized, f, indent=4, ensure_ascii=False)
+            text += f"\n\nFlow otimizado gravado em {output_file}"
+
+        if arguments.get("deploy"):
+            if flow_file:
+                text += "\n\nDeploy ignorado: só é feito ao analisar os flows implantados (sem flow_file)."
+            elif report["nodes_after"] == report["nodes_before"]:
+                text += "\n\nNada a implantar: o flow já está otimizado."
+            else:
+                await node_red_api.post_flows(optimized)
+                text += "\n\nFlow otimizado implantado no Node-RED."
+
+        return [TextContent(type="text", text=text)]
+
+    except Exception as e:
+        logger.error(f"Erro ao analisar flow: {str(e)}")
+        return tool_error(f"Erro ao analisar flow: {str(e)}")
 
 
 # Função principal para executar o servidor
@@ -845,13 +1916,26 @@ async def main():
     """Função principal para executar o servidor MCP"""
     logger.info("Iniciando servidor MCP para Node-RED...")
     
+    gpio_scheduler.load()
+    gpio_scheduler.start()
+    # Retira uma suspensão de planos deixada por uma execução anterior
+    await sync_action_plan_suspension()
+    dht_feed.start()
+    
     # Executar servidor via stdio
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                server.create_initialization_options()
+            )
+    finally:
+        await dht_feed.stop()
+        await sync_action_plan_suspension(shutting_down=True)
+        await gpio_scheduler.stop()
+        if hasattr(node_red_api.transport, "close"):
+            node_red_api.transport.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
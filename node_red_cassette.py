@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Gravação e reprodução (record/replay) do tráfego HTTP com o Node-RED
+
+Permite capturar todas as requisições/respostas feitas pelo servidor MCP a um
+Node-RED real, com os tempos de cada uma, em um arquivo "cassete" compacto
+(JSON Lines, opcionalmente .gz). O cassete pode depois ser servido às
+ferramentas do main.py sem o Raspberry Pi nem o ESP8266, em velocidade real
+(1x), acelerada (Nx) ou sem espera (0).
+
+Uso pelo servidor (variáveis de ambiente lidas pelo main.py):
+    NODE_RED_RECORD=trafego.jsonl.gz      → grava o tráfego real
+    NODE_RED_REPLAY=trafego.jsonl.gz      → serve o cassete no lugar do Node-RED
+    NODE_RED_REPLAY_SPEED=10              → 1 = tempo real, N = N vezes mais rápido, 0 = sem espera
+
+Uso em linha de comando:
+    python node_red_cassette.py info trafego.jsonl.gz
+    python node_red_cassette.py bench trafego.jsonl.gz --tool get_dht_sensor_mcp -n 200 -c 20 --speed 0
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+import httpx
+
+CASSETTE_VERSION = 1
+
+# Cabeçalhos de resposta preservados no cassete (os demais dependem do transporte)
+KEPT_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+
+
+class CassetteMissError(Exception):
+    """Requisição sem resposta correspondente no cassete"""
+
+
+def _open_cassette(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _request_path(request: httpx.Request) -> str:
+    """Caminho + query da requisição, sem o host (o cassete independe do IP do Node-RED)"""
+    path = request.url.raw_path.decode("ascii")
+    return path or "/"
+
+
+def _body_digest(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()[:12] if body else ""
+
+
+def load_cassette(path: str) -> List[Dict[str, Any]]:
+    """Lê todas as interações de um cassete, ignorando o cabeçalho"""
+    entries = []
+    with _open_cassette(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "cassette" in entry:
+                if entry["cassette"] > CASSETTE_VERSION:
+                    raise ValueError(f"Versão de cassete não suportada: {entry['cassette']}")
+                continue
+            entries.append(entry)
+    return entries
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Transporte httpx que repassa as requisições ao Node-RED e grava cada par requisição/resposta"""
+
+    def __init__(self, path: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.path = path
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self._file = _open_cassette(path, "w")
+        self._start = time.monotonic()
+        self._file.write(json.dumps({"cassette": CASSETTE_VERSION, "created": time.time()}) + "\n")
+        self._file.flush()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS}
+        entry = {
+            "t": round(started - self._start, 4),
+            "ms": round(elapsed_ms, 2),
+            "method": request.method,
+            "path": _request_path(request),
+            "req": _body_digest(body),
+            "status": response.status_code,
+            "headers": headers,
+            "body": content.decode("utf-8", errors="replace"),
+        }
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=headers,
+            content=content,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        # O transporte é compartilhado entre os clientes criados por NodeRedAPI.client();
+        # fechar um cliente não deve encerrar a gravação
+        pass
+
+    def close(self) -> None:
+        """Fecha o arquivo do cassete (chamado no encerramento do servidor)"""
+        if not self._file.closed:
+            self._file.close()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte httpx que responde a partir de um cassete gravado.
+
+    As respostas de cada (método, caminho, corpo) são servidas na ordem em que
+    foram gravadas; esgotada a sequência, a última resposta é repetida, o que
+    permite testes de carga com mais requisições do que as gravadas.
+    speed=1 reproduz a latência original, speed=N divide-a por N e speed=0
+    responde imediatamente.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, strict: bool = False):
+        if speed < 0:
+            raise ValueError("speed deve ser >= 0")
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        self._exact: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = defaultdict(list)
+        self._loose: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[tuple, int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        for entry in load_cassette(path):
+            self._exact[(entry["method"], entry["path"], entry.get("req", ""))].append(entry)
+            self._loose[(entry["method"], entry["path"])].append(entry)
+
+    def _next(self, key: tuple, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        index = self._cursor[key]
+        self._cursor[key] = index + 1
+        return entries[min(index, len(entries) - 1)]
+
+    @staticmethod
+    def _full_response(entries: List[Dict[str, Any]], not_modified: Dict[str, Any]) -> Dict[str, Any]:
+        """Última resposta com corpo gravada antes do 304 (ou depois, se não houver)"""
+        index = next(i for i, e in enumerate(entries) if e is not_modified)
+        for candidate in list(reversed(entries[:index])) + entries[index + 1:]:
+            if candidate["status"] != 304:
+                return candidate
+        return not_modified
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        path = _request_path(request)
+        exact_key = (request.method, path, _body_digest(body))
+        loose_key = (request.method, path)
+
+        if exact_key in self._exact:
+            entries = self._exact[exact_key]
+            entry = self._next(exact_key, entries)
+        elif not self.strict and loose_key in self._loose:
+            entries = self._loose[loose_key]
+            entry = self._next(loose_key, entries)
+        else:
+            self.misses += 1
+            raise CassetteMissError(f"Sem resposta gravada para {request.method} {path}")
+
+        # Um 304 só vale para quem enviou If-None-Match; um cliente sem o corpo em
+        # cache (ex: requisições concorrentes) recebe a resposta completa gravada antes
+        if entry["status"] == 304 and "if-none-match" not in request.headers:
+            entry = self._full_response(entries, entry)
+
+        self.hits += 1
+        if self.speed > 0:
+            await asyncio.sleep(entry["ms"] / 1000 / self.speed)
+
+        return httpx.Response(
+            status_code=entry["status"],
+            headers=entry.get("headers", {}),
+            content=entry["body"].encode("utf-8"),
+            request=request,
+        )
+
+
+def transport_from_env() -> Optional[httpx.AsyncBaseTransport]:
+    """Cria o transporte de gravação/reprodução conforme NODE_RED_RECORD / NODE_RED_REPLAY"""
+    replay = os.environ.get("NODE_RED_REPLAY")
+    record = os.environ.get("NODE_RED_RECORD")
+    if replay and record:
+        raise ValueError("NODE_RED_RECORD e NODE_RED_REPLAY não podem ser usados juntos")
+    if replay:
+        speed = float(os.environ.get("NODE_RED_REPLAY_SPEED", "1"))
+        strict = os.environ.get("NODE_RED_REPLAY_STRICT", "") in ("1", "true")
+        return ReplayTransport(replay, speed=speed, strict=strict)
+    if record:
+        return RecordingTransport(record)
+    return None
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil pelo vizinho mais próximo (0.0 sem valores); usado também pelo esp8266_simulator"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def cmd_info(args: argparse.Namespace) -> None:
+    """Resumo do cassete: interações e latência por endpoint"""
+    entries = load_cassette(args.cassette)
+    by_endpoint: Dict[str, List[float]] = defaultdict(list)
+    total_bytes = 0
+    for entry in entries:
+        by_endpoint[f"{entry['method']} {entry['path']}"].append(entry["ms"])
+        total_bytes += len(entry["body"].encode("utf-8"))
+
+    span = entries[-1]["t"] - entries[0]["t"] if entries else 0
+    print(f"Cassete: {args.cassette}")
+    print(f"  Interações : {len(entries)}")
+    print(f"  Duração    : {span:.1f} s")
+    print(f"  Corpo total: {total_bytes} bytes\n")
+    print(f"  {'endpoint':<45} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for endpoint, times in sorted(by_endpoint.items()):
+        print(f"  {endpoint:<45} {len(times):>5} {percentile(times, 50):>9.1f} "
+              f"{percentile(times, 95):>9.1f} {max(times):>9.1f}")
+
+
+async def _bench(args: argparse.Namespace) -> None:
+    # Import tardio: o main.py depende do SDK MCP, desnecessário para "info"
+    import main
+
+    transport = ReplayTransport(args.cassette, speed=args.speed, strict=args.strict)
+    main.node_red_api.transport = transport
+    arguments = json.loads(args.arguments)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    outputs: Dict[str, int] = defaultdict(int)
+
+    async def one_call() -> None:
+        async with semaphore:
+            started = time.monotonic()
+            result = await main.handle_call_tool(args.tool, arguments)
+            latencies.append((time.monotonic() - started) * 1000)
+            outputs[hashlib.sha1(result.content[0].text.encode("utf-8")).hexdigest()[:12]] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(one_call() for _ in range(args.requests)))
+    elapsed = time.monotonic() - started
+
+    print(f"Ferramenta {args.tool} × {args.requests} (concorrência {args.concurrency}, velocidade {args.speed}x)")
+    print(f"  Tempo total : {elapsed:.2f} s ({args.requests / elapsed:.1f} chamadas/s)")
+    print(f"  Latência    : p50 {percentile(latencies, 50):.1f} ms | "
+          f"p95 {percentile(latencies, 95):.1f} ms | max {max(latencies):.1f} ms")
+    print(f"  Cassete     : {transport.hits} acertos, {transport.misses} faltas")
+    print(f"  Respostas distintas: {len(outputs)}")
+    for digest, count in sorted(outputs.items(), key=lambda item: -item[1]):
+        print(f"    {digest}  × {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gravação/reprodução do tráfego com o Node-RED")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    info = sub.add_parser("info", help="Resumo do cassete")
+    info.add_argument("cassette")
+    info.set_defaults(func=cmd_info)
+
+    bench = sub.add_parser("bench", help="Teste de carga das ferramentas do main.py sobre o cassete")
+    bench.add_argument("cassette")
+    bench.add_argument("--tool", required=True, help="Ferramenta MCP a chamar (ex: get_dht_sensor_mcp)")
+    bench.add_argument("--arguments", default="{}", help="Argumentos da ferramenta em JSON")
+    bench.add_argument("-n", "--requests", type=int, default=100)
+    bench.add_argument("-c", "--concurrency", type=int, default=10)
+    bench.add_argument("--speed", type=float, default=1.0, help="1 = tempo real, N = N vezes mais rápido, 0 = sem espera")
+    bench.add_argument("--strict", action="store_true", help="Exigir corpo de requisição idêntico ao gravado")
+    bench.set_defaults(func=lambda a: asyncio.run(_bench(a)))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Detecção online de anomalias nas leituras do DHT11
+
+Para cada device mantém apenas alguns números (memória constante): média e
+variância por EWMA para o z-score (com desvio mínimo igual à resolução do sensor), a última leitura para detectar saltos
+impossíveis e um contador de leituras idênticas para detectar sensor travado.
+Um device fica sinalizado enquanto houver anomalia e volta ao normal após
+algumas leituras limpas seguidas. Leituras possíveis, mas fora da faixa de
+precisão do datasheet, geram só um aviso e não sinalizam o device.
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Valores fisicamente impossíveis para o sensor: sinalizam o device
+PHYSICAL_TEMP_RANGE = (-40.0, 80.0)
+PHYSICAL_HUMIDITY_RANGE = (0.0, 100.0)
+
+# Faixa de precisão do DHT11 (datasheet): fora dela a leitura é real, mas imprecisa,
+# e gera apenas um aviso — ex: umidade acima de 90 % não deve suspender um exaustor
+DHT11_TEMP_RANGE = (0.0, 50.0)
+DHT11_HUMIDITY_RANGE = (20.0, 90.0)
+
+# Saltos acima destas taxas não são físicos em ambiente interno
+MAX_TEMP_RATE_PER_MIN = 5.0
+MAX_HUMIDITY_RATE_PER_MIN = 20.0
+
+# Z-score sobre média/variância EWMA
+Z_THRESHOLD = 4.0
+EWMA_ALPHA = 0.1
+WARMUP_READINGS = 10
+
+# Resolução do DHT11 (1 °C / 1 %): piso do desvio-padrão no z-score. Sem ele a
+# variância tende a zero em trechos estáveis e o degrau seguinte de uma deriva
+# lenta (um quantum) vira um z-score enorme
+SENSOR_RESOLUTION = {"temperature": 1.0, "humidity": 1.0}
+
+# O DHT11 tem resolução de 1 °C / 1 %: valores repetidos por algum tempo são
+# normais em ambiente estável (uma deriva de 1 °C a cada 30 min fica 60 leituras
+# parada), por isso o limiar padrão é de ~1 h (leituras a cada 30 s)
+FLATLINE_READINGS = 120
+
+# Leituras limpas seguidas para retirar a sinalização do device
+RECOVERY_READINGS = 3
+
+# Intervalo acima do qual o salto entre leituras não é avaliado (s)
+MAX_JUMP_GAP_S = 600.0
+
+METRICS = ("temperature", "humidity")
+
+
+class _MetricState:
+    __slots__ = ("mean", "var", "samples", "last", "last_suspicious", "out_of_spec")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+        self.last: Optional[float] = None
+        self.last_suspicious = False
+        self.out_of_spec = False
+
+    def update_stats(self, x: float, alpha: float) -> None:
+        if self.samples == 0:
+            self.mean = x
+        else:
+            # Média e variância exponenciais (West, 1979)
+            diff = x - self.mean
+            incr = alpha * diff
+            self.mean += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.samples += 1
+
+
+class _DeviceState:
+    __slots__ = ("metrics", "last_t", "flat_count", "clean_count", "flagged", "reasons")
+
+    def __init__(self):
+        self.metrics = {m: _MetricState() for m in METRICS}
+        self.last_t: Optional[float] = None
+        self.flat_count = 0
+        self.clean_count = 0
+        self.flagged = False
+        self.reasons: List[str] = []
+
+
+class AnomalyDetector:
+    """Detector de anomalias (z-score, salto impossível, fora da faixa, sensor travado) por device"""
+
+    def __init__(
+        self,
+        z_threshold: float = Z_THRESHOLD,
+        flatline_readings: int = FLATLINE_READINGS,
+        max_temp_rate: float = MAX_TEMP_RATE_PER_MIN,
+        max_humidity_rate: float = MAX_HUMIDITY_RATE_PER_MIN,
+    ):
+        self.z_threshold = z_threshold
+        self.flatline_readings = flatline_readings
+        self.max_rate = {"temperature": max_temp_rate, "humidity": max_humidity_rate}
+        self.ranges = {"temperature": PHYSICAL_TEMP_RANGE, "humidity": PHYSICAL_HUMIDITY_RANGE}
+        self.spec_ranges = {"temperature": DHT11_TEMP_RANGE, "humidity": DHT11_HUMIDITY_RANGE}
+        self._devices: Dict[str, _DeviceState] = {}
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "z_threshold": self.z_threshold,
+            "flatline_readings": self.flatline_readings,
+            "max_temp_rate": self.max_rate["temperature"],
+            "max_humidity_rate": self.max_rate["humidity"],
+        }
+
+    def configure(self, **kwargs: Any) -> None:
+        """Altera os limiares; o estado acumulado dos devices é mantido"""
+        if "z_threshold" in kwargs:
+            self.z_threshold = float(kwargs["z_threshold"])
+        if "flatline_readings" in kwargs:
+            self.flatline_readings = int(kwargs["flatline_readings"])
+        if "max_temp_rate" in kwargs:
+            self.max_rate["temperature"] = float(kwargs["max_temp_rate"])
+        if "max_humidity_rate" in kwargs:
+            self.max_rate["humidity"] = float(kwargs["max_humidity_rate"])
+
+    def is_flagged(self, device_id: str) -> bool:
+        state = self._devices.get(device_id)
+        return bool(state and state.flagged)
+
+    def flagged_devices(self) -> Dict[str, List[str]]:
+        """Devices sinalizados e os motivos da última anomalia"""
+        return {d: list(s.reasons) for d, s in sorted(self._devices.items()) if s.flagged}
+
+    def update(self, device_id: str, temperature: float, humidity: float, t: float) -> List[Dict[str, Any]]:
+        """
+        Avalia uma leitura nova (t em segundos epoch) e retorna os eventos gerados:
+        anomalias detectadas, avisos de leitura fora da faixa de precisão e,
+        quando for o caso, a recuperação do device.
+        """
+        state = self._devices.get(device_id)
+        if state is None:
+            state = self._devices[device_id] = _DeviceState()
+
+        values = {"temperature": float(temperature), "humidity": float(humidity)}
+        timestamp = datetime.fromtimestamp(t).astimezone().isoformat(timespec="seconds")
+        dt = None if state.last_t is None else t - state.last_t
+        findings: List[Dict[str, Any]] = []
+        warnings: List[Dict[str, Any]] = []
+
+        for metric, x in values.items():
+            ms = state.metrics[metric]
+            low, high = self.ranges[metric]
+            suspicious = False
+
+            if not math.isfinite(x) or x < low or x > high:
+                findings.append({"kind": "out_of_range", "metric": metric, "value": x,
+                                 "detail": f"valor impossível (faixa física {low:g}–{high:g})"})
+                suspicious = True
+            # A volta ao normal depois de uma leitura impossível não é um novo salto
+            elif ms.last is not None and not ms.last_suspicious and dt is not None and 0 < dt <= MAX_JUMP_GAP_S:
+                rate = abs(x - ms.last) / max(dt / 60, 1 / 60)
+                if rate > self.max_rate[metric]:
+                    findings.append({"kind": "jump", "metric": metric, "value": x,
+                                     "detail": f"salto de {ms.last:g} para {x:g} ({rate:.1f}/min)"})
+                    suspicious = True
+
+            if not suspicious and ms.samples >= WARMUP_READINGS:
+                std = max(math.sqrt(ms.var), SENSOR_RESOLUTION[metric])
+                z = (x - ms.mean) / std
+                if abs(z) > self.z_threshold:
+                    findings.append({"kind": "zscore", "metric": metric, "value": x,
+                                     "detail": f"z={z:+.1f} (média {ms.mean:.1f}, desvio {std:.2f})"})
+
+            # Aviso só ao sair da faixa de precisão, não a cada leitura enquanto fora dela
+            spec_low, spec_high = self.spec_ranges[metric]
+            out_of_spec = not suspicious and (x < spec_low or x > spec_high)
+            if out_of_spec and not ms.out_of_spec:
+                warnings.append({"kind": "out_of_spec", "metric": metric, "value": x,
+                                 "detail": f"fora da faixa de precisão do DHT11 ({spec_low:g}–{spec_high:g})"})
+            ms.out_of_spec = out_of_spec
+
+            # Leituras impossíveis não contaminam a média e a variância
+            if not suspicious:
+                ms.update_stats(x, EWMA_ALPHA)
+            ms.last_suspicious = suspicious
+
+        # flat_count conta as leituras idênticas seguidas, incluindo a atual;
+        # o evento é emitido uma vez, mas o device segue sinalizado enquanto travado
+        same = all(state.metrics[m].last == values[m] for m in METRICS)
+        state.flat_count = state.flat_count + 1 if same else 1
+        flat = bool(self.flatline_readings) and state.flat_count >= self.flatline_readings
+        if flat and state.flat_count == self.flatline_readings:
+            findings.append({"kind": "flatline", "metric": "temperature/humidity", "value": values["temperature"],
+                             "detail": f"{state.flat_count} leituras idênticas seguidas"})
+
+        for metric, x in values.items():
+            state.metrics[metric].last = x
+        state.last_t = t
+
+        events = []
+        for finding in findings:
+            events.append({"type": "anomaly", "device_id": device_id, "timestamp": timestamp, **finding})
+        for warning in warnings:
+            events.append({"type": "anomaly_warning", "device_id": device_id, "timestamp": timestamp, **warning})
+
+        if findings or flat:
+            state.clean_count = 0
+            if findings:
+                state.reasons = sorted({f["kind"] for f in findings})
+            state.flagged = True
+        elif state.flagged:
+            state.clean_count += 1
+            if state.clean_count >= RECOVERY_READINGS:
+                state.flagged = False
+                state.reasons = []
+                events.append({"type": "anomaly_recovered", "device_id": device_id, "timestamp": timestamp,
+                               "kind": "recovered", "metric": "", "value": None,
+                               "detail": f"{RECOVERY_READINGS} leituras normais seguidas"})
+        return events
+
+
+def format_anomaly(event: Dict[str, Any]) -> str:
+    """Linha de texto de um evento de anomalia, no formato da lista de alertas"""
+    labels = {
+        "out_of_range": "Leitura impossível",
+        "out_of_spec": "Fora da precisão",
+        "jump": "Salto impossível",
+        "zscore": "Valor atípico",
+        "flatline": "Sensor travado",
+        "recovered": "Sensor normalizado",
+    }
+    label = labels.get(event["kind"], event["kind"])
+    metric = f" {event['metric']}" if event.get("metric") else ""
+    return f"  [{event['timestamp']}] {label} ({event['device_id']}){metric}: {event['detail']}"
@@ -0,0 +1,131 @@
+"""
+Alimentação contínua das leituras do DHT11
+
+Entrega cada leitura nova às métricas e ao detector de anomalias do servidor
+sem depender de chamadas de ferramenta. Dois modos:
+    - mqtt:    com MQTT_HOST definido e o aiomqtt instalado, assina
+               mcp/sensor/dht/data e recebe a leitura de cada device, com o
+               device_id publicado pelo firmware;
+    - polling: consulta GET /mcp/sensor/dht do Node-RED a cada DHT_INTERVAL_S.
+               O Node-RED guarda só a última leitura (global dht_data), então
+               neste modo cada ciclo vê apenas o último device que publicou.
+
+Variáveis de ambiente (mesmos nomes do config.h do firmware):
+    MQTT_HOST, MQTT_PORT (padrão 1883), MQTT_USER, MQTT_PASSWORD
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import aiomqtt
+except ImportError:  # dependência opcional: sem ela o modo é sempre polling
+    aiomqtt = None
+
+logger = logging.getLogger("mcp-node-red.sensor_feed")
+
+# Intervalo de leitura do DHT no firmware (DHT_INTERVAL_MS)
+DHT_INTERVAL_S = 30.0
+
+# Espera antes de reconectar ao broker (MQTT_RECONNECT_DELAY_MS do firmware)
+MQTT_RECONNECT_DELAY_S = 5.0
+
+DHT_DATA_TOPIC = "mcp/sensor/dht/data"
+
+
+class DhtFeed:
+    """Tarefa de fundo que repassa as leituras do DHT11 ao servidor"""
+
+    def __init__(
+        self,
+        observer: Callable[[Dict[str, Any]], Awaitable[bool]],
+        fetcher: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        interval: float = DHT_INTERVAL_S,
+        mqtt_host: Optional[str] = None,
+        mqtt_port: int = 1883,
+        mqtt_user: Optional[str] = None,
+        mqtt_password: Optional[str] = None,
+    ):
+        self.observer = observer
+        self.fetcher = fetcher
+        self.interval = interval
+        self.mqtt_host = mqtt_host
+        self.mqtt_port = mqtt_port
+        self.mqtt_user = mqtt_user
+        self.mqtt_password = mqtt_password
+        self.readings = 0
+        self._task: Optional[asyncio.Task] = None
+        if mqtt_host and aiomqtt is None:
+            logger.warning("MQTT_HOST definido, mas o aiomqtt não está instalado; usando polling do Node-RED")
+
+    @classmethod
+    def from_env(cls, observer, fetcher) -> "DhtFeed":
+        return cls(
+            observer,
+            fetcher,
+            mqtt_host=os.environ.get("MQTT_HOST") or None,
+            mqtt_port=int(os.environ.get("MQTT_PORT", "1883")),
+            mqtt_user=os.environ.get("MQTT_USER") or None,
+            mqtt_password=os.environ.get("MQTT_PASSWORD") or None,
+        )
+
+    @property
+    def mode(self) -> str:
+        return "mqtt" if self.mqtt_host and aiomqtt is not None else "polling"
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._subscribe() if self.mode == "mqtt" else self._poll())
+            logger.info(f"Leituras do DHT11 em modo {self.mode}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                # O fetcher repassa a leitura ao observer; repetidas são descartadas pelo timestamp
+                if await self.fetcher() is not None:
+                    self.readings += 1
+            except Exception as e:
+                logger.warning(f"Falha ao consultar o DHT11 no Node-RED: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def _subscribe(self) -> None:
+        while True:
+            try:
+                async with aiomqtt.Client(
+                    self.mqtt_host, self.mqtt_port,
+                    username=self.mqtt_user, password=self.mqtt_password,
+                ) as client:
+                    await client.subscribe(DHT_DATA_TOPIC)
+                    async for message in client.messages:
+                        # A mensagem retida é a última leitura antiga, anterior à conexão
+                        if message.retain:
+                            continue
+                        await self._handle(message.payload)
+            except aiomqtt.MqttError as e:
+                logger.warning(f"Conexão MQTT perdida ({str(e)}); reconectando em {MQTT_RECONNECT_DELAY_S:g} s")
+                await asyncio.sleep(MQTT_RECONNECT_DELAY_S)
+
+    async def _handle(self, payload: bytes) -> None:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        # O timestamp do firmware é millis() desde o boot; vale o horário de chegada
+        data["timestamp"] = time.time()
+        if await self.observer(data):
+            self.readings += 1
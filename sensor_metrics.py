@@ -0,0 +1,216 @@
+"""
+Métricas derivadas incrementais para o sensor DHT11
+
+Cada nova leitura atualiza o estado do device em O(1): ponto de orvalho e
+índice de calor são calculados da própria leitura, a taxa de variação usa
+somas acumuladas de uma regressão linear sobre a janela deslizante (5 min)
+e os valores suavizados usam EWMA com decaimento pelo tempo decorrido.
+Nada é recalculado sobre o histórico.
+"""
+
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Janela da taxa de variação (s)
+SLOPE_WINDOW_S = 300.0
+
+# Constante de tempo da EWMA (s): leituras mais antigas que ~tau pesam ~37%
+EWMA_TAU_S = 120.0
+
+# Constantes de Magnus (Alduchov & Eskridge) para o ponto de orvalho
+MAGNUS_B = 17.625
+MAGNUS_C = 243.04
+
+
+def parse_timestamp(value: Any) -> float:
+    """Converte o timestamp do Node-RED (ISO 8601) ou epoch em segundos; usa o relógio local se ausente"""
+    if isinstance(value, (int, float)):
+        # Epoch em ms (Date.now()) ou em s
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+def dew_point(temperature: float, humidity: float) -> float:
+    """Ponto de orvalho (°C) pela fórmula de Magnus"""
+    humidity = min(max(humidity, 1e-6), 100.0)
+    gamma = math.log(humidity / 100.0) + MAGNUS_B * temperature / (MAGNUS_C + temperature)
+    return MAGNUS_C * gamma / (MAGNUS_B - gamma)
+
+
+def heat_index(temperature: float, humidity: float) -> float:
+    """Índice de calor (°C) pela regressão de Rothfusz (NOAA), com os ajustes de faixa"""
+    t = temperature * 9 / 5 + 32
+    rh = humidity
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    if (simple + t) / 2 < 80:
+        hi = simple
+    else:
+        hi = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+              - 6.83783e-3 * t * t - 5.481717e-2 * rh * rh + 1.22874e-3 * t * t * rh
+              + 8.5282e-4 * t * rh * rh - 1.99e-6 * t * t * rh * rh)
+        if rh < 13 and 80 <= t <= 112:
+            hi -= ((13 - rh) / 4) * math.sqrt((17 - abs(t - 95)) / 17)
+        elif rh > 85 and 80 <= t <= 87:
+            hi += ((rh - 85) / 10) * ((87 - t) / 5)
+    return (hi - 32) * 5 / 9
+
+
+class _SlidingSlope:
+    """Regressão linear sobre uma janela de tempo mantida por somas acumuladas"""
+
+    __slots__ = ("window", "origin", "points", "n", "st", "sx", "stt", "stx")
+
+    def __init__(self, window: float):
+        self.window = window
+        self.origin: Optional[float] = None
+        self.points: deque = deque()
+        self.n = 0
+        self.st = self.sx = self.stt = self.stx = 0.0
+
+    def add(self, t: float, x: float) -> None:
+        if self.origin is None:
+            self.origin = t
+        # Tempo relativo à primeira leitura para não perder precisão nas somas
+        t -= self.origin
+        self.points.append((t, x))
+        self.n += 1
+        self.st += t
+        self.sx += x
+        self.stt += t * t
+        self.stx += t * x
+        # Cada ponto entra e sai uma única vez: O(1) amortizado
+        while self.points and t - self.points[0][0] > self.window:
+            old_t, old_x = self.points.popleft()
+            self.n -= 1
+            self.st -= old_t
+            self.sx -= old_x
+            self.stt -= old_t * old_t
+            self.stx -= old_t * old_x
+
+    def slope(self) -> Optional[float]:
+        """Inclinação em unidades por segundo, ou None com menos de dois pontos"""
+        if self.n < 2:
+            return None
+        denominator = self.n * self.stt - self.st * self.st
+        if abs(denominator) < 1e-9:
+            return None
+        return (self.n * self.stx - self.st * self.sx) / denominator
+
+
+class _Ewma:
+    """Média móvel exponencial com peso proporcional ao tempo entre leituras"""
+
+    __slots__ = ("tau", "value", "last_t")
+
+    def __init__(self, tau: float):
+        self.tau = tau
+        self.value: Optional[float] = None
+        self.last_t: Optional[float] = None
+
+    def add(self, t: float, x: float) -> None:
+        if self.value is None:
+            self.value = x
+        else:
+            alpha = 1.0 - math.exp(-max(t - self.last_t, 0.0) / self.tau)
+            self.value += alpha * (x - self.value)
+        self.last_t = t
+
+
+class _DeviceMetrics:
+    __slots__ = ("temperature", "humidity", "timestamp", "count",
+                 "temp_slope", "hum_slope", "temp_ewma", "hum_ewma")
+
+    def __init__(self, window: float, tau: float):
+        self.temperature = self.humidity = 0.0
+        self.timestamp = 0.0
+        self.count = 0
+        self.temp_slope = _SlidingSlope(window)
+        self.hum_slope = _SlidingSlope(window)
+        self.temp_ewma = _Ewma(tau)
+        self.hum_ewma = _Ewma(tau)
+
+
+class SensorMetricsEngine:
+    """Mantém as métricas derivadas de vários devices, atualizadas a cada leitura nova"""
+
+    def __init__(self, slope_window: float = SLOPE_WINDOW_S, ewma_tau: float = EWMA_TAU_S):
+        self.slope_window = slope_window
+        self.ewma_tau = ewma_tau
+        self._devices: Dict[str, _DeviceMetrics] = {}
+
+    def update(self, device_id: str, temperature: float, humidity: float, timestamp: Any = None) -> bool:
+        """
+        Registra uma leitura. Retorna False (sem alterar o estado) se ela não for
+        mais nova que a última do device — a mesma leitura pode ser consultada
+        várias vezes no Node-RED.
+        """
+        t = parse_timestamp(timestamp)
+        state = self._devices.get(device_id)
+        if state is None:
+            state = self._devices[device_id] = _DeviceMetrics(self.slope_window, self.ewma_tau)
+        elif t <= state.timestamp:
+            return False
+
+        temperature = float(temperature)
+        humidity = float(humidity)
+        state.temperature = temperature
+        state.humidity = humidity
+        state.timestamp = t
+        state.count += 1
+        state.temp_slope.add(t, temperature)
+        state.hum_slope.add(t, humidity)
+        state.temp_ewma.add(t, temperature)
+        state.hum_ewma.add(t, humidity)
+        return True
+
+    def devices(self) -> List[str]:
+        return sorted(self._devices)
+
+    def metrics(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Métricas atuais do device, ou None se ele ainda não enviou leituras"""
+        state = self._devices.get(device_id)
+        if state is None:
+            return None
+        temp_slope = state.temp_slope.slope()
+        hum_slope = state.hum_slope.slope()
+        return {
+            "device_id": device_id,
+            "temperature": state.temperature,
+            "humidity": state.humidity,
+            "dew_point": round(dew_point(state.temperature, state.humidity), 2),
+            "heat_index": round(heat_index(state.temperature, state.humidity), 2),
+            "temp_rate_per_min": None if temp_slope is None else round(temp_slope * 60, 3),
+            "humidity_rate_per_min": None if hum_slope is None else round(hum_slope * 60, 3),
+            "temp_ewma": round(state.temp_ewma.value, 2),
+            "humidity_ewma": round(state.hum_ewma.value, 2),
+            "window_readings": state.temp_slope.n,
+            "readings": state.count,
+            "timestamp": datetime.fromtimestamp(state.timestamp).astimezone().isoformat(timespec="seconds"),
+        }
+
+    def all_metrics(self, device_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        ids = self.devices() if device_ids is None else device_ids
+        return [m for m in (self.metrics(d) for d in ids) if m is not None]
+
+
+def format_metrics(m: Dict[str, Any]) -> str:
+    """Bloco de texto com as métricas derivadas de um device"""
+    def rate(value: Optional[float], unit: str) -> str:
+        return "N/A (poucas leituras)" if value is None else f"{value:+.3f} {unit}/min"
+
+    return (
+        f"  Ponto de orvalho : {m['dew_point']} °C\n"
+        f"  Índice de calor  : {m['heat_index']} °C\n"
+        f"  Variação temp.   : {rate(m['temp_rate_per_min'], '°C')} (janela 5 min, {m['window_readings']} leituras)\n"
+        f"  Variação umidade : {rate(m['humidity_rate_per_min'], '%')}\n"
+        f"  Temp. suavizada  : {m['temp_ewma']} °C\n"
+        f"  Umid. suavizada  : {m['humidity_ewma']} %"
+    )
@@ -0,0 +1,69 @@
+"""Detecção e unificação de assinaturas MQTT e cadeias de funções (flow_analyzer)"""
+
+from flow_analyzer import find_identical_function_chains, optimize_flows
+
+
+def _mqtt_in(node_id, wires):
+    return {"id": node_id, "type": "mqtt in", "z": "tab", "broker": "b", "topic": "mcp/sensor/dht/data",
+            "qos": "0", "datatype": "json", "wires": [wires]}
+
+
+def _function(node_id, func, wires):
+    return {"id": node_id, "type": "function", "z": "tab", "name": node_id, "func": func,
+            "outputs": 1, "wires": [wires]}
+
+
+def _duplicated_chains_flow():
+    # Dois assinantes do mesmo tópico, cada um com a mesma cadeia parse → converter → saída
+    return [
+        {"id": "tab", "type": "tab"},
+        _mqtt_in("sub_a", ["parse_a"]),
+        _mqtt_in("sub_b", ["parse_b"]),
+        _function("parse_a", "msg.payload = msg.payload.temperature; return msg;", ["conv_a"]),
+        _function("conv_a", "msg.payload = msg.payload * 1.8 + 32; return msg;", ["out"]),
+        _function("parse_b", "msg.payload = msg.payload.temperature; return msg;", ["conv_b"]),
+        _function("conv_b", "msg.payload = msg.payload * 1.8 + 32; return msg;", ["out"]),
+        {"id": "out", "type": "debug", "z": "tab", "wires": []},
+    ]
+
+
+def test_identical_chains_are_found_node_by_node():
+    groups = find_identical_function_chains(_duplicated_chains_flow())
+
+    assert [[[n["id"] for n in chain] for chain in group] for group in groups] == [
+        [["parse_a", "conv_a"], ["parse_b", "conv_b"]]
+    ]
+
+
+def test_chains_are_only_reported_without_merge_functions():
+    optimized, report = optimize_flows(_duplicated_chains_flow())
+
+    assert report["functions"][0]["length"] == 2
+    assert report["functions"][0]["same_outputs"] and not report["functions"][0]["merged"]
+    assert {"parse_b", "conv_b"} <= {n["id"] for n in optimized}
+
+
+def test_merged_subscriber_feeds_a_single_chain():
+    optimized, report = optimize_flows(_duplicated_chains_flow(), merge_functions=True)
+    by_id = {n["id"]: n for n in optimized}
+
+    assert set(by_id) == {"tab", "sub_a", "parse_a", "conv_a", "out"}
+    assert by_id["sub_a"]["wires"] == [["parse_a"]]
+    assert report["functions"][0]["executions_saved_per_message"] == 2
+
+
+def test_chains_with_different_code_are_not_grouped():
+    flows = _duplicated_chains_flow()
+    flows[6]["func"] = "msg.payload = msg.payload + 273.15; return msg;"  # conv_b em Kelvin
+
+    assert find_identical_function_chains(flows) == []
+
+
+def test_shared_node_breaks_the_chain():
+    flows = _duplicated_chains_flow()
+    flows.append({"id": "inject", "type": "inject", "z": "tab", "wires": [["conv_b"]]})
+    groups = find_identical_function_chains(flows)
+
+    # conv_b recebe de dois nós: a cadeia de parse_b termina nele, e parse_a → conv_a não é
+    # mais equivalente — unificá-las removeria um nó que o inject ainda usa
+    assert groups == []
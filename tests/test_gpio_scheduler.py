@@ -0,0 +1,161 @@
+"""Recarga de agendamentos GPIO gravados e execução com falhas (GpioScheduler)"""
+
+import asyncio
+import json
+import time
+
+import gpio_scheduler
+from gpio_scheduler import GpioScheduler
+
+
+async def _noop(gpios):
+    return None
+
+
+def _write(path, schedules):
+    path.write_text(json.dumps({"schedules": schedules}), encoding="utf-8")
+
+
+def _one_shot(schedule_id, next_run, duration_minutes=None):
+    # Mesmo formato gravado por GpioScheduler.add (duration_minutes é None quando omitido)
+    return {
+        "id": schedule_id,
+        "pin": 4,
+        "state": "on",
+        "at": "23:59",
+        "cron": None,
+        "duration_minutes": duration_minutes,
+        "description": "",
+        "next_run": next_run,
+        "pending_end": None,
+        "created": next_run - 3600,
+    }
+
+
+def test_missed_one_shot_without_duration_is_dropped(tmp_path):
+    path = tmp_path / "gpio_schedules.json"
+    _write(path, [_one_shot("a", time.time() - 60)])
+
+    scheduler = GpioScheduler(_noop, path)
+    scheduler.load()
+
+    assert scheduler.schedules == {}
+    assert json.loads(path.read_text(encoding="utf-8"))["schedules"] == []
+
+
+def test_missed_one_shot_with_open_window_keeps_original_end(tmp_path):
+    path = tmp_path / "gpio_schedules.json"
+    started = time.time() - 240
+    _write(path, [_one_shot("a", started, duration_minutes=10)])
+
+    scheduler = GpioScheduler(_noop, path)
+    scheduler.load()
+
+    schedule = scheduler.schedules["a"]
+    assert schedule["duration_minutes"] == 10
+    assert schedule["pending_end"] == started + 600
+    assert schedule["next_run"] <= time.time()
+
+
+def test_invalid_entry_does_not_block_the_others(tmp_path):
+    path = tmp_path / "gpio_schedules.json"
+    future = time.time() + 3600
+    _write(path, [{"id": "broken"}, _one_shot("b", future, duration_minutes=None)])
+
+    scheduler = GpioScheduler(_noop, path)
+    scheduler.load()
+
+    assert list(scheduler.schedules) == ["b"]
+
+
+def test_unreadable_file_is_kept_and_ignored(tmp_path):
+    path = tmp_path / "gpio_schedules.json"
+    path.write_text("{not json", encoding="utf-8")
+
+    scheduler = GpioScheduler(_noop, path)
+    scheduler.load()
+
+    assert scheduler.schedules == {}
+    assert path.read_text(encoding="utf-8") == "{not json"
+
+
+def _run_until(scheduler, condition, timeout=2.0):
+    async def runner():
+        scheduler.start()
+        try:
+            deadline = time.monotonic() + timeout
+            while not condition() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        finally:
+            await scheduler.stop()
+    asyncio.run(runner())
+
+
+def test_failed_batch_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(gpio_scheduler, "RETRY_DELAY_S", 0.05)
+    path = tmp_path / "gpio_schedules.json"
+    _write(path, [_one_shot("a", time.time() + 0.05)])
+    calls = []
+
+    async def flaky(gpios):
+        calls.append(gpios)
+        if len(calls) == 1:
+            raise ConnectionError("Node-RED fora do ar")
+
+    scheduler = GpioScheduler(flaky, path)
+    scheduler.load()
+    _run_until(scheduler, lambda: scheduler.batches_sent == 1)
+
+    assert calls == [[{"pin": 4, "state": "on"}]] * 2
+    assert scheduler.batches_sent == 1
+    assert json.loads(path.read_text(encoding="utf-8"))["failed_gpios"] == []
+
+
+def test_failed_batch_survives_restart(tmp_path):
+    path = tmp_path / "gpio_schedules.json"
+    _write(path, [_one_shot("a", time.time() + 0.05)])
+
+    async def offline(gpios):
+        raise ConnectionError("Node-RED fora do ar")
+
+    scheduler = GpioScheduler(offline, path)
+    scheduler.load()
+    _run_until(scheduler, lambda: scheduler._failed)
+
+    sent = []
+
+    async def online(gpios):
+        sent.append(gpios)
+
+    restarted = GpioScheduler(online, path)
+    restarted.load()
+    _run_until(restarted, lambda: sent)
+
+    assert sent == [[{"pin": 4, "state": "on"}]]
+
+
+def test_unexpected_error_does_not_stop_the_loop(tmp_path, monkeypatch):
+    path = tmp_path / "gpio_schedules.json"
+    now = time.time()
+    # Mais de SAME_INSTANT_S entre os dois, para que saiam em lotes separados
+    _write(path, [_one_shot("a", now + 0.05), _one_shot("b", now + 1.2)])
+    sent = []
+
+    async def executor(gpios):
+        sent.append(gpios)
+
+    scheduler = GpioScheduler(executor, path)
+    scheduler.load()
+    saves = []
+    original_save = scheduler._save
+
+    def failing_save():
+        saves.append(1)
+        if len(saves) == 1:
+            raise OSError("disco cheio")
+        original_save()
+
+    monkeypatch.setattr(scheduler, "_save", failing_save)
+    _run_until(scheduler, lambda: len(sent) == 2, timeout=3.0)
+
+    assert len(sent) == 2
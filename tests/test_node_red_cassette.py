@@ -0,0 +1,50 @@
+"""Reprodução de cassetes com respostas 304 gravadas (ReplayTransport)"""
+
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from node_red_cassette import ReplayTransport
+
+
+def _cassette(path, entries):
+    lines = [{"cassette": 1, "created": 0}] + entries
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n", encoding="utf-8")
+
+
+def _entry(status, body=""):
+    return {"t": 0, "ms": 0, "method": "GET", "path": "/mcp/tools", "req": "",
+            "status": status, "headers": {"etag": '"v1"'}, "body": body}
+
+
+def _get(transport, headers=None):
+    async def request():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get("http://node-red/mcp/tools", headers=headers or {})
+    return asyncio.run(request())
+
+
+def test_recorded_304_without_if_none_match_serves_the_full_response(tmp_path):
+    path = tmp_path / "trafego.jsonl"
+    _cassette(path, [_entry(200, '{"tools": []}'), _entry(304)])
+    transport = ReplayTransport(str(path), speed=0)
+
+    first = _get(transport)
+    second = _get(transport)
+
+    assert (first.status_code, second.status_code) == (200, 200)
+    assert second.text == '{"tools": []}'
+
+
+def test_recorded_304_is_kept_for_revalidation(tmp_path):
+    path = tmp_path / "trafego.jsonl"
+    _cassette(path, [_entry(200, '{"tools": []}'), _entry(304)])
+    transport = ReplayTransport(str(path), speed=0)
+
+    _get(transport)
+    second = _get(transport, headers={"If-None-Match": '"v1"'})
+
+    assert second.status_code == 304
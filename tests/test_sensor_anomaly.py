@@ -0,0 +1,33 @@
+"""Detector de anomalias do DHT11 com leituras quantizadas (resolução de 1 °C / 1 %)"""
+
+from sensor_anomaly import AnomalyDetector
+
+
+def _feed(detector, temperatures, humidity=50.0, interval_s=30.0):
+    events = []
+    for i, temperature in enumerate(temperatures):
+        events.extend(detector.update("esp8266-01", temperature, humidity, 1_700_000_000 + i * interval_s))
+    return events
+
+
+def _drift(step_every, steps, start=20.0):
+    # Ambiente derivando 1 °C a cada `step_every` leituras, como o DHT11 reporta
+    return [start + i // step_every for i in range(step_every * steps)]
+
+
+def test_slow_drift_is_not_an_anomaly():
+    for step_every in (30, 60):  # 1 °C a cada 15 e a cada 30 min (leituras a cada 30 s)
+        detector = AnomalyDetector()
+        events = _feed(detector, _drift(step_every, steps=10))
+
+        assert [e for e in events if e["type"] == "anomaly"] == []
+        assert not detector.is_flagged("esp8266-01")
+
+
+def test_large_deviation_after_stable_period_is_flagged():
+    detector = AnomalyDetector(flatline_readings=0)
+    # 6 °C em 2 min: abaixo do limite de salto (5 °C/min), mas z = -6 com o desvio mínimo
+    events = _feed(detector, [22.0] * 40 + [16.0], interval_s=120.0)
+
+    assert [e["kind"] for e in events if e["type"] == "anomaly"] == ["zscore"]
+    assert detector.is_flagged("esp8266-01")